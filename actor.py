@@ -1,29 +1,52 @@
-import math
 import random
 from genotype import Genotype
 
 
 class Actor(object):
-    def __init__(self, world, id_, fitness_evaluation, genotype=None, position=None):
+    def __init__(self, world, id_, fitness_evaluation, genotype=None, position=None, phenotype_cache=None):
         self.world = world
         self.id = id_
+        self.phenotype_cache = phenotype_cache
+        self.compiled_brain = None
         self._fitness_evaluation_function = fitness_evaluation
         self._fitness = None
+        self.objectives = None
+        self.positions = None  # final position in every scenario of the world, when there are several
         self.genotype = genotype or Genotype()
-        self.build_phenotype()
         self.position = position or (random.randint(0, world.SIZE[0]),
                                      random.randint(0, world.SIZE[1]))
 
     def __repr__(self):
         return "{1}  {0}  {2}".format(self._fitness, self.id, self.genotype)
 
+    def __getattr__(self, attr):
+        # phenotypes are decoded on first use, so actors simulated elsewhere never pay for it
+        if attr == "dead":
+            # screened from the genes, dead actors never build their phenotypes
+            self.dead = not self.genotype.viable
+            return self.dead
+        if attr in ("brain", "properties", "body"):
+            self.build_phenotype()
+            return getattr(self, attr)
+        raise AttributeError("'{0}' object has no attribute '{1}'".format(self.__class__.__name__, attr))
+
     def build_phenotype(self):
-        self.dead = False
-        self.brain = self.genotype.get_phenotype("brain")
-        self.properties = self.genotype.get_phenotype("properties")
-        self.body = self.genotype.get_phenotype("body")
-        if not (self.brain.viable and self.body.viable and self.properties.viable):
-            self.dead = True
+        """Decodes the phenotypes, sharing them with the actors of the same genome when cached
+
+        Shared phenotypes are templates and are never modified: actors think and learn with compiled copies,
+        whose weights are only read back to draw their graph.
+        """
+        phenotypes = None
+        if self.phenotype_cache is not None:
+            key = self.genotype.digest()
+            phenotypes = self.phenotype_cache.get(key)
+        if phenotypes is None:
+            phenotypes = (self.genotype.get_phenotype("brain"),
+                          self.genotype.get_phenotype("properties"),
+                          self.genotype.get_phenotype("body"))
+            if self.phenotype_cache is not None:
+                self.phenotype_cache.put(key, phenotypes)
+        self.brain, self.properties, self.body = phenotypes
 
     def fitness_evaluation(self, *args, **kwargs):
         self._fitness = self._fitness_evaluation_function(self, *args, **kwargs)
@@ -38,34 +61,3 @@ class Actor(object):
         self._fitness = fitness
 
     fitness = property(get_fitness, set_fitness)
-
-    def directions_to_center(self):
-        x = self.world.point[0] - self.position[0]
-        y = self.world.point[1] - self.position[1]
-        vec_len = float(math.sqrt((abs(x)**2) + (abs(y)**2)))
-        norm_x = float(x) / vec_len
-        norm_y = float(y) / vec_len
-        return norm_x, norm_y
-
-    def update(self):
-        if self.dead:
-            return
-        xu, yu = self.directions_to_center()
-        x, y = self.brain.think([xu, yu], 2)
-        self.move(x, y)
-
-        for color, shape in self.body.parts():
-            if color and shape:
-                self.world.draw(((color + 1) ** 2) - 1, self.translate_shape(shape))
-
-    def move(self, where_x, where_y):
-        xo, yo = self.position
-        xo += where_x * self.world.tslf / 10 * self.properties.speed
-        yo += where_y * self.world.tslf / 10 * self.properties.speed
-        self.position = min(max(0, xo), self.world.SIZE[0] - 5), min(max(0, yo), self.world.SIZE[1] - 5)
-
-    def translate_shape(self, shape):
-        return map(lambda p: tuple(map(sum, zip(p, self.position))), shape)
-
-    def brain_graph(self):
-        self.brain.draw_net("graph{0}.png".format(self.id))
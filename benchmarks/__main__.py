@@ -0,0 +1,65 @@
+"""Runs the benchmark suite and saves its results as JSON.
+
+From the repository root: `python -m benchmarks --output results.json`, then on another commit
+`python -m benchmarks --compare results.json` to list the cases that got slower.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+from benchmarks import suite
+
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"]).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key(result):
+    return result["name"], result["population"], tuple(result["gene_length"])
+
+
+def compare(results, reference, tolerance):
+    """Returns the results slower than their reference by more than `tolerance`, with their ratio"""
+    previous = dict((key(result), result) for result in reference["results"])
+    regressions = []
+    for result in results:
+        if key(result) in previous:
+            ratio = result["seconds"] / previous[key(result)]["seconds"]
+            if ratio > 1.0 + tolerance:
+                regressions.append((result, ratio))
+    return regressions
+
+
+def report(result):
+    sys.stderr.write("{name:<24} pop {population:>5}  genes {gene_length[0]}-{gene_length[1]}  "
+                     "{seconds:.5f}s\n".format(**result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all of them by default")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--quick", action="store_true", help="smallest population and genome length only")
+    args = parser.parse_args()
+    sizes = suite.POPULATION_SIZES[:1] if args.quick else suite.POPULATION_SIZES
+    lengths = suite.GENE_LENGTHS[:1] if args.quick else suite.GENE_LENGTHS
+    results = suite.run(args.names, sizes, lengths, report=report)
+    document = {"revision": revision(), "time": time.time(), "seed": suite.SEED, "repeat": suite.REPEAT,
+                "python": platform.python_version(), "numpy": np.__version__, "results": results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(document, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as reference:
+            regressions = compare(results, json.load(reference), args.tolerance)
+        for result, ratio in regressions:
+            sys.stderr.write("REGRESSION {name} pop {population} genes {gene_length}: x{0:.2f}\n".format(ratio, **result))
+        sys.exit(1 if regressions else 0)
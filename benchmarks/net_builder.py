@@ -0,0 +1,37 @@
+"""Scaling of Brain.net_builder with the number of connections.
+
+Run from the repository root with `python -m benchmarks.net_builder`.
+"""
+import random
+import timeit
+from genotype import Genotype
+from phenotypes.brain import Brain
+
+SIZES = [10, 100, 1000, 10000]
+NEURON_IDS = 256  # as decoded with a neuron_id_code_length of 2
+REPEAT = 3
+
+
+def random_connections(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.randrange(NEURON_IDS), rng.uniform(-1.0, 1.0), rng.randrange(NEURON_IDS)) for _ in xrange(count)]
+
+
+def build(connections):
+    brain = Brain(Genotype(""), [], Genotype.GENE_DEFINITION["brain"])
+    brain.net_builder(connections)
+    return brain
+
+
+def run(sizes=SIZES):
+    results = []
+    for size in sizes:
+        connections = random_connections(size)
+        seconds = min(timeit.repeat(lambda: build(connections), number=1, repeat=REPEAT))
+        results.append({"connections": size, "synapses": len(build(connections).connections), "seconds": seconds})
+    return results
+
+
+if __name__ == "__main__":
+    for result in run():
+        print("{connections:>6} connections  {synapses:>6} synapses  {seconds:.4f}s".format(**result))
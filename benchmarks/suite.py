@@ -0,0 +1,221 @@
+"""Micro and macro benchmarks of the hot paths, at several population sizes and genome lengths.
+
+Every case rebuilds its inputs from a fixed seed before each timed repeat and reports the best
+time, so results of different commits can be compared.
+"""
+import random
+import timeit
+import numpy as np
+from genotype import Genotype
+from population import Population
+from phenotypes.brain import PopulationBrain
+from experiment import Experiment
+from streams import DEFAULT
+
+SEED = 0
+REPEAT = 3
+POPULATION_SIZES = [100, 500, 2000]
+GENE_LENGTHS = [(100, 200), (400, 800)]
+BENCHMARKS = []
+
+
+def benchmark(function):
+    BENCHMARKS.append(function)
+    return function
+
+
+def seed(offset=0):
+    random.seed(SEED + offset)
+    np.random.seed(SEED + offset)
+    DEFAULT.seed(SEED + offset)
+
+
+def genotypes(size):
+    return Genotype.batch(size)
+
+
+def viable_brains(size):
+    brains = [genotype.get_phenotype("brain") for genotype in genotypes(size)]
+    return [brain for brain in brains if brain.viable]
+
+
+def measure(setup, run):
+    """Best time of `run(state)` over REPEAT runs, each with a fresh `state = setup()`"""
+    times = []
+    for repeat in xrange(REPEAT):
+        seed(repeat)
+        state = setup()
+        seed(repeat)
+        start = timeit.default_timer()
+        run(state)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+@benchmark
+def generate_dna(size):
+    repairs = [0]
+    repair = Genotype.repair
+
+    def counting(self, *args):
+        repaired = repair(self, *args)
+        repairs[0] += repaired
+        return repaired
+
+    Genotype.repair = counting
+    try:
+        seconds = measure(lambda: None, lambda _: genotypes(size))
+    finally:
+        Genotype.repair = repair
+    return seconds, {"repairs_per_genome": float(repairs[0]) / (REPEAT * size)}
+
+
+@benchmark
+def extract_genes(size):
+    return measure(lambda: genotypes(size), lambda state: [genotype.extract_genes() for genotype in state]), {}
+
+
+@benchmark
+def crossover(size):
+    return measure(lambda: genotypes(size),
+                   lambda state: [Genotype.crossover(state[i - 1].dna, state[i].dna) for i in xrange(size)]), {}
+
+
+@benchmark
+def mutate(size):
+    return measure(lambda: genotypes(size), lambda state: [genotype.mutate() for genotype in state]), {}
+
+
+@benchmark
+def reproduce(size):
+    return measure(lambda: genotypes(size),
+                   lambda state: [Genotype.reproduce(state[i - 1], state[i]) for i in xrange(size)]), {}
+
+
+@benchmark
+def reproduce_batch(size):
+    return measure(lambda: genotypes(size), lambda state: Genotype.reproduce_batch(state[-1:] + state[:-1], state)), {}
+
+
+@benchmark
+def brain_decoding(size):
+    """Brain.gene_parser and net_builder"""
+    return measure(lambda: genotypes(size), lambda state: [genotype.get_phenotype("brain") for genotype in state]), {}
+
+
+@benchmark
+def body_decoding(size):
+    return measure(lambda: genotypes(size), lambda state: [genotype.get_phenotype("body") for genotype in state]), {}
+
+
+@benchmark
+def properties_decoding(size):
+    return measure(lambda: genotypes(size),
+                   lambda state: [genotype.get_phenotype("properties") for genotype in state]), {}
+
+
+@benchmark
+def brain_think(size):
+    """One tick of every brain through the object graph"""
+    return measure(lambda: viable_brains(size), lambda state: [brain.think([0.5, -0.5], 2) for brain in state]), {}
+
+
+@benchmark
+def compiled_brain_think(size):
+    return measure(lambda: [brain.compile() for brain in viable_brains(size)],
+                   lambda state: [brain.think([0.5, -0.5], 2) for brain in state]), {}
+
+
+@benchmark
+def population_brain_think(size):
+    def setup():
+        brain = PopulationBrain([brain.compile() for brain in viable_brains(size)])
+        return brain, np.random.uniform(-1.0, 1.0, (brain.count, 2))
+
+    return measure(setup, lambda state: state[0].think(state[1], 2)), {}
+
+
+class Scored(object):
+    def __init__(self, fitness):
+        self.fitness = fitness
+
+
+def scored_population(size):
+    population = Population(rank_probability=Experiment.RANK_PROBABILITY_CONSTANT)
+    for _ in xrange(size):
+        population.append(Scored(random.random()))
+    return population
+
+
+@benchmark
+def population_sort(size):
+    return measure(lambda: scored_population(size), lambda state: state.sort()), {}
+
+
+@benchmark
+def select_by_rank(size):
+    """Parents of a whole generation, one by one"""
+    return measure(lambda: scored_population(size), lambda state: [state.select_by_rank() for _ in xrange(2 * size)]), {}
+
+
+@benchmark
+def select(size):
+    """Parents of a whole generation, in bulk"""
+    return measure(lambda: scored_population(size), lambda state: state.select(2 * size)), {}
+
+
+def experiment(size):
+    experiment = Experiment(headless=True, seed=SEED)
+    experiment.POP_SIZE = size
+    experiment.RANDOM_ACTORS_NUMBER = size // 10
+    experiment.populate()
+    return experiment
+
+
+@benchmark
+def simulation(size):
+    """Every tick of a generation"""
+    return measure(lambda: experiment(size), lambda state: state.simulate(state.world.TICKS_PER_GEN)), {}
+
+
+@benchmark
+def next_generation(size):
+    """Evaluation, reproduction and phenotype build of a simulated generation"""
+    def setup():
+        state = experiment(size)
+        state.simulate(state.world.TICKS_PER_GEN)
+        return state
+
+    return measure(setup, lambda state: state.next_generation()), {}
+
+
+@benchmark
+def generation(size):
+    """Simulation then next_generation"""
+    def run(state):
+        state.simulate(state.world.TICKS_PER_GEN)
+        state.next_generation()
+
+    return measure(lambda: experiment(size), run), {}
+
+
+def run(names=None, population_sizes=POPULATION_SIZES, gene_lengths=GENE_LENGTHS, report=None):
+    results = []
+    default_length = Genotype.GENE_LENGTH
+    try:
+        for gene_length in gene_lengths:
+            Genotype.GENE_LENGTH = list(gene_length)
+            for function in BENCHMARKS:
+                if names and function.__name__ not in names:
+                    continue
+                for size in population_sizes:
+                    seconds, extra = function(size)
+                    result = {"name": function.__name__, "population": size, "gene_length": list(gene_length),
+                              "seconds": seconds, "per_item": seconds / size}
+                    result.update(extra)
+                    results.append(result)
+                    if report:
+                        report(result)
+    finally:
+        Genotype.GENE_LENGTH = default_length
+    return results
@@ -0,0 +1,107 @@
+import os
+import mmap
+import struct
+import pickle
+import numpy as np
+from genotype import Genotype
+
+
+class Checkpoint(object):
+    """Append-only file holding one record per evaluated generation.
+
+    A record is a fixed size header followed by the fitness (float64), actor ids and DNA lengths
+    (uint32) of the population, its nibble-packed DNA and the pickled state of the experiment's random stream. Reading maps
+    the file in memory and only walks the record headers. A record cut short by an interrupted run is dropped before
+    the next one is appended.
+    """
+    MAGIC = b"GAICKPT2"
+    HEADER = struct.Struct("<4sIIIIQ4x")  # marker, generation, actors, dna bytes, rng bytes, record size
+    MARKER = b"GEN0"
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.offsets = {}
+        self.end = 0  # end of the last complete record
+        if os.path.exists(path) and os.path.getsize(path) > len(self.MAGIC):
+            self.index()
+
+    def index(self):
+        if self.map is not None:
+            self.map.close()
+        with open(self.path, "rb") as checkpoint:
+            self.map = mmap.mmap(checkpoint.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError("{0} is not a checkpoint file".format(self.path))
+        self.offsets = {}
+        offset = len(self.MAGIC)
+        while offset + self.HEADER.size <= len(self.map):
+            marker, generation, _, _, _, size = self.HEADER.unpack_from(self.map, offset)
+            # a record cut short by an interrupted run is ignored
+            if marker != self.MARKER or offset + size > len(self.map):
+                break
+            self.offsets[generation] = offset
+            offset += size
+        self.end = offset
+
+    @property
+    def generations(self):
+        return sorted(self.offsets)
+
+    def write(self, generation, population, rng_state):
+        actors = list(population)
+        packed = [actor.genotype.pack() for actor in actors]
+        dna = b"".join(packed)
+        rng = pickle.dumps(rng_state, 2)
+        arrays = (np.array([actor.fitness for actor in actors], dtype="<f8").tobytes() +
+                  np.array([actor.id for actor in actors], dtype="<u4").tobytes() +
+                  np.array([len(actor.genotype.dna) for actor in actors], dtype="<u4").tobytes())
+        size = self.HEADER.size + len(arrays) + len(dna) + len(rng)
+        if self.file is None:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file = open(self.path, "ab")
+            # records appended after what an interrupted run left of one could never be found again
+            self.file.truncate(self.end)
+            if not self.end:
+                self.file.write(self.MAGIC)
+        self.file.write(self.HEADER.pack(self.MARKER, generation, len(actors), len(dna), len(rng), size))
+        self.file.write(arrays + dna + rng)
+        self.file.flush()
+
+    def read(self, generation=None):
+        """Returns the ids, fitness, genotypes and random stream state saved for a generation, the last by default"""
+        if self.file is not None:
+            self.file.flush()
+        self.index()
+        if not self.offsets:
+            raise ValueError("{0} holds no generation".format(self.path))
+        if generation is None:
+            generation = self.generations[-1]
+        offset = self.offsets[generation]
+        _, _, count, dna_size, rng_size, _ = self.HEADER.unpack_from(self.map, offset)
+        offset += self.HEADER.size
+        # copied, the mapping being closed by the next read
+        fitness = np.frombuffer(self.map, dtype="<f8", count=count, offset=offset).copy()
+        offset += 8 * count
+        ids = np.frombuffer(self.map, dtype="<u4", count=count, offset=offset).copy()
+        offset += 4 * count
+        lengths = np.frombuffer(self.map, dtype="<u4", count=count, offset=offset)
+        offset += 4 * count
+        genotypes = []
+        for length in lengths.tolist():
+            size = (length + 1) // 2
+            genotypes.append(Genotype.unpack(self.map[offset:offset + size], length))
+            offset += size
+        rng = pickle.loads(self.map[offset:offset + rng_size])
+        return generation, ids, fitness, genotypes, rng
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class Convergence(object):
+    """Watches the episode of a kernel and tells when its outcome can't change much anymore
+
+    The rules, checked after every step, are: no actor is alive, all live actors moved less than
+    TOLERANCE for PATIENCE steps in a row, or the mean distance of the BEST actors nearest to a
+    target did not shrink by IMPROVEMENT for PATIENCE steps in a row.
+    """
+    PATIENCE = 15
+    TOLERANCE = 0.01
+    BEST = 10
+    IMPROVEMENT = 0.5
+
+    def __init__(self):
+        self.positions = None
+        self.still = 0
+        self.best = float("inf")
+        self.stalled = 0
+
+    def update(self, kernel):
+        """Returns the name of the rule ending the episode after this step, None while it goes on"""
+        if not len(kernel.alive_index):
+            return "no_live_actors"
+        positions = kernel.positions[kernel.rows]
+        if self.positions is not None and abs(positions - self.positions).max() < self.TOLERANCE:
+            self.still += 1
+        else:
+            self.still = 0
+        self.positions = positions
+        if self.still >= self.PATIENCE:
+            return "stationary"
+        distances = kernel.target_distances(positions)
+        best = min(self.BEST, len(distances))
+        best = np.partition(distances, best - 1)[:best].mean()
+        if best < self.best - self.IMPROVEMENT:
+            self.best = best
+            self.stalled = 0
+        else:
+            self.stalled += 1
+        if self.stalled >= self.PATIENCE:
+            return "best_stalled"
+        return None
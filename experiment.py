@@ -1,61 +1,327 @@
-import math
-import random
+from collections import namedtuple
 from genotype import Genotype
 from world import World
 from actor import Actor
 from population import Population
+from kernel import PopulationKernel
+from parallel import ParallelSimulator
+from cache import LRUCache
+from checkpoint import Checkpoint
+from graphs import GraphExporter
+from streams import RandomStream
+from steady import SteadyState
+from halloffame import HallOfFame
+from convergence import Convergence
+import metrics
+
+
+# what run yields for every evaluated generation, the timings being those of the metrics sample
+GenerationSummary = namedtuple("GenerationSummary", ["generation", "best_fitness", "mean_fitness", "best_dna",
+                                                     "dead_actors", "seconds", "phases"])
 
 
 class Experiment(object):
     POP_SIZE = 500
     RANDOM_ACTORS_NUMBER = 50
     RANK_PROBABILITY_CONSTANT = 0.2
+    SELECTION = None  # a selection.Selection, rank selection with RANK_PROBABILITY_CONSTANT by default
+    ELITE_NUMBER = 0  # best actors copied as they are into the next generation
+    REPRODUCTION_POLICY = "repair"  # what becomes of non viable children, see Genotype.reproduce
+    SCENARIO_AGGREGATE = "mean"  # how distances to the targets of several scenarios are combined, "mean" or "worst"
+    PHENOTYPE_CACHE_SIZE = 10000
 
-    def __init__(self):
-        self.world = World(self)
-        self.population = Population(rank_probability=self.RANK_PROBABILITY_CONSTANT, reverse_sort=False)
+    def __init__(self, headless=False, seed=None, workers=1, checkpoint=None, metrics_path=None, metrics_format="jsonl",
+                 render_fps=None, graphs=0, multi_objective=False, steady_state=0, targets=None, obstacles=None,
+                 hall_of_fame=0, early_stop=False, scenarios=None):
+        # a list of integers seeds an independent stream too, see RandomStream.spawn
+        self.rng = RandomStream(seed)
+        self.multi_objective = multi_objective
+        if workers > 1 and not headless:
+            raise ValueError("A generation can only be shared between workers in headless mode")
+        if steady_state and not headless:
+            raise ValueError("Steady-state evolution only runs in headless mode")
+        if headless:
+            self.world = World(self, targets, obstacles, scenarios)
+        else:
+            from viewer import Viewer
+            self.world = Viewer(self, render_fps, targets, obstacles, scenarios)
+        self.population = self.new_population()
         self.pop_index = 1
         self.current_generation = 1
+        self.last_generation = None
+        self.kernel = None
+        self.immigrants = []
+        self.simulator = ParallelSimulator(workers) if workers > 1 else None
+        self.phenotype_cache = LRUCache(self.PHENOTYPE_CACHE_SIZE)
+        # headless simulations are deterministic, so identical actors of a generation are simulated once
+        self.deduplicate = headless
+        self.replays = []
+        self.checkpoint = Checkpoint(checkpoint) if checkpoint else None
+        if metrics_path:
+            metrics.enable(metrics_path, metrics_format)
+        self.graphs = graphs  # brain graphs of the best actors written every generation
+        self.graph_exporter = GraphExporter()
+        # episodes end as soon as a Convergence rule says their outcome won't change much anymore
+        self.early_stop = early_stop
+        self.convergence = None
+        self.stopped_early = None  # rule and ticks saved of the last episode that ended early
+        self.last_sample = None  # metrics sample of the last generation exported
+        # best distinct genomes met during the run, e.g. to immigrate them again
+        self.hall_of_fame = HallOfFame(hall_of_fame)
+        # evolves in overlapping cohorts of that many actors instead of generations
+        self.steady = SteadyState(self, steady_state) if steady_state else None
 
-    def start(self):
-        for _ in xrange(self.POP_SIZE):
-            self.population.append(self.create_actor())
+    def start(self, generations=None):
+        """Runs until stopped or, if given, until `generations` generations have been evaluated"""
+        if generations is not None:
+            self.last_generation = self.current_generation + generations - 1
+        if self.steady is not None:
+            self.steady.start()
+            return
+        if not len(self.population):
+            self.populate()
         self.world.start()
 
-    @staticmethod
-    def evaluate_fitness(actor):
+    def run(self, generations=None):
+        """Generator running like start, yielding a GenerationSummary after every evaluated generation
+
+        The run only goes on while the generator is iterated, without any window or event polling, and
+        closing it stops the experiment. Each step blocks for a whole generation: an asyncio loop should
+        drive it from an executor, e.g. loop.run_in_executor(None, next, generator).
+        """
+        if generations is not None:
+            self.last_generation = self.current_generation + generations - 1
+        metrics.record()
+        try:
+            if self.steady is not None:
+                for _ in self.steady.run():
+                    yield self.summary()
+                return
+            if not len(self.population):
+                self.populate()
+            self.world.loop = True
+            while self.world.loop:
+                self.simulate(self.world.TICKS_PER_GEN - self.world.tick)
+                if not self.world.loop:
+                    break
+                self.evaluate()
+                self.end_generation(stop=False)
+                yield self.summary()
+                if self.finished() or not self.world.loop:
+                    break
+                self.breed()
+        finally:
+            # a generator leaves no file behind but what was asked for
+            if self.world.loop:
+                self.stop(graph=bool(self.graphs))
+
+    def summary(self):
+        """Returns the GenerationSummary of the generation just evaluated"""
+        # the lowest summed fitness, which with multi_objective may not be the first actor of the ranking
+        best = min(self.population, key=lambda actor: actor.fitness)
+        live = [actor.fitness for actor in self.population if not actor.dead]
+        sample = self.last_sample or {}
+        return GenerationSummary(self.current_generation, best.fitness,
+                                 sum(live) / len(live) if live else float("nan"), str(best.genotype),
+                                 len(self.population) - len(live), sample.get("seconds"), sample.get("phases", {}))
+
+    def resume(self, generation=None):
+        """Restores an evaluated generation from the checkpoint file and breeds the next one from it"""
+        generation, ids, fitness, genotypes, rng_state = self.checkpoint.read(generation)
+        self.population = self.new_population()
+        for id_, fitness_, genotype in zip(ids.tolist(), fitness.tolist(), genotypes):
+            actor = Actor(self.world, id_, self.evaluate_fitness, genotype=genotype, position=(0, 0),
+                          phenotype_cache=self.phenotype_cache)
+            actor.fitness = fitness_
+            self.population.append(actor)
+        self.pop_index = max(ids.tolist()) + 1
+        self.current_generation = generation
+        self.rng.setstate(rng_state)
+        if self.steady is not None:
+            # the cohorts that were running are not saved, new ones are bred from the population
+            self.current_generation += 1
+        else:
+            self.breed()
+
+    def populate(self):
+        with metrics.current.timer("reproduction"):
+            for genotype in Genotype.batch(self.POP_SIZE, self.rng):
+                self.population.append(self.create_actor(genotype))
+        self.setup_generation()
+
+    @classmethod
+    def evaluate_objectives(cls, actor):
+        """Distance to the nearest target, color difference and vertex count penalty, all minimized
+
+        With several scenarios, the distance is the mean or the worst of the distances in each of them.
+        """
         if actor.dead:
-            return 0xFFFFFFF
-        x = actor.position[0] - float(actor.world.point[0])
-        y = actor.position[1] - float(actor.world.point[1])
-        vec_len = float(math.sqrt((x**2) + (y**2)))
+            return (0xFFFFFFF,) * 3
+        if actor.positions is None:
+            vec_len = actor.world.target_distance(actor.position)
+        else:
+            distances = [world.target_distance(position)
+                         for world, position in zip(actor.world.scenarios, actor.positions)]
+            vec_len = max(distances) if cls.SCENARIO_AGGREGATE == "worst" else sum(distances) / len(distances)
         color_diff = float(abs(0x00F - actor.body.color))
         vertex_handicap = float(len(actor.body.polygon)**3)
-        return vec_len + color_diff + vertex_handicap
+        return vec_len, color_diff, vertex_handicap
+
+    @classmethod
+    def evaluate_fitness(cls, actor):
+        if actor.dead:
+            return 0xFFFFFFF
+        return sum(cls.evaluate_objectives(actor))
 
-    def create_actor(self, genotype=None):
-        actor = Actor(self.world, self.pop_index, self.evaluate_fitness, genotype=genotype, position=(0, 0))
+    def new_population(self):
+        return Population(rank_probability=self.RANK_PROBABILITY_CONSTANT, reverse_sort=False,
+                          selection=self.SELECTION, rng=self.rng,
+                          objectives=self.evaluate_objectives if self.multi_objective else None)
+
+    def create_actor(self, genotype=None, world=None):
+        if genotype is None:
+            genotype = Genotype(rng=self.rng)
+        actor = Actor(world or self.world, self.pop_index, self.evaluate_fitness, genotype=genotype, position=(0, 0),
+                      phenotype_cache=self.phenotype_cache)
         self.pop_index += 1
         return actor
 
+    def setup_generation(self):
+        self.world.reset()
+        self.stopped_early = None
+        self.replays = []
+        if self.simulator is None:
+            actors = self.population
+            if self.deduplicate:
+                actors = self.split_replays()
+            with metrics.current.timer("phenotype_build"):
+                self.kernel = PopulationKernel(self.world, actors)
+            metrics.current.count("dead_actors", len(self.kernel.actors) - len(self.kernel.alive_index))
+            self.convergence = Convergence() if self.early_stop else None
+
+    def split_replays(self):
+        """Returns the actors to simulate, leaving out those identical to an actor already being simulated"""
+        simulated = []
+        representatives = {}
+        for actor in self.population:
+            key = (actor.genotype.digest(), actor.position)
+            if key in representatives:
+                self.replays.append((actor, representatives[key]))
+            else:
+                representatives[key] = actor
+                simulated.append(actor)
+        return simulated
+
+    def simulate(self, ticks):
+        """Runs the next `ticks` simulation steps of the current generation"""
+        with metrics.current.timer("simulation"):
+            if self.simulator is not None:
+                self.simulator.simulate(self, ticks)
+            elif not len(self.kernel.alive_index):
+                # no actor can move, the outcome is known without a step
+                if self.convergence is not None and ticks > 0:
+                    self.end_episode("no_live_actors", ticks)
+                self.world.tick += max(ticks, 0)
+            else:
+                for _ in xrange(ticks):
+                    self.world.loop_step()
+                    if self.converged():
+                        break
+
+    def converged(self):
+        """Ends the episode of the current generation if its outcome won't change much anymore"""
+        if self.convergence is None:
+            return False
+        rule = self.convergence.update(self.kernel)
+        if rule is None:
+            return False
+        self.end_episode(rule, self.world.TICKS_PER_GEN - self.world.tick)
+        self.world.tick = self.world.TICKS_PER_GEN
+        return True
+
+    def end_episode(self, rule, saved):
+        self.stopped_early = (rule, saved)
+        metrics.current.count("early_stop_" + rule)
+        metrics.current.count("ticks_saved", saved)
+
     def next_generation(self):
-        self.world.stop()
-        self.population.evaluate()
-        new_pop = Population(rank_probability=self.RANK_PROBABILITY_CONSTANT, reverse_sort=False)
-        for _ in xrange(self.RANDOM_ACTORS_NUMBER):
-            new_pop.append(self.create_actor())
-        for _ in xrange(self.POP_SIZE - self.RANDOM_ACTORS_NUMBER):
-            new_genotype = Genotype.reproduce(self.population.select_by_rank().genotype,
-                                              self.population.select_by_rank().genotype)
-            new_pop.append(self.create_actor(genotype=new_genotype))
-        self.population = new_pop
+        self.evaluate()
+        self.end_generation()
+        if self.world.loop:
+            self.breed()
+
+    def end_generation(self, stop=True):
+        """Saves and exports the evaluated generation, then stops if it was the last one unless `stop` is False"""
+        if self.hall_of_fame.size:
+            self.hall_of_fame.update(self.population, self.current_generation)
+        if self.checkpoint is not None:
+            self.checkpoint.write(self.current_generation, self.population, self.rng.getstate())
+        if self.graphs:
+            self.graph_exporter.export_best(self.population, self.current_generation, self.graphs)
+        self.last_sample = metrics.current.export(self.current_generation)
+        if stop and self.finished():
+            self.stop()
+
+    def finished(self):
+        """Whether the current generation is the last one to evaluate"""
+        return self.last_generation is not None and self.current_generation >= self.last_generation
+
+    def evaluate(self):
+        if self.kernel is not None:
+            with metrics.current.timer("fitness"):
+                self.kernel.sync()
+                for actor, representative in self.replays:
+                    actor.position = representative.position
+                    actor.positions = representative.positions
+                self.population.evaluate()
+        if self.multi_objective:
+            self.population.evaluate_objectives()
+
+    def immigrate(self, genotypes):
+        """Queues genotypes coming from elsewhere to be part of the next generation as they are"""
+        self.immigrants.extend(genotypes)
+
+    def breed(self):
+        with metrics.current.timer("reproduction"):
+            self.reproduce()
         self.current_generation += 1
-        self.world.start()
+        self.setup_generation()
+
+    def reproduce(self):
+        new_pop = self.new_population()
+        for genotype in Genotype.batch(self.RANDOM_ACTORS_NUMBER, self.rng):
+            new_pop.append(self.create_actor(genotype))
+        for genotype in self.immigrants[:self.POP_SIZE - self.RANDOM_ACTORS_NUMBER]:
+            new_pop.append(self.create_actor(genotype=genotype))
+        self.immigrants = []
+        for elite in self.population.select_best_fitnesses(min(self.ELITE_NUMBER, self.POP_SIZE - len(new_pop))):
+            new_pop.append(self.create_actor(genotype=Genotype(elite.genotype.dna)))
+        parents = self.population.select(2 * (self.POP_SIZE - len(new_pop)))
+        children = Genotype.reproduce_batch([father.genotype for father in parents[::2]],
+                                            [mother.genotype for mother in parents[1::2]],
+                                            self.REPRODUCTION_POLICY, self.rng)
+        for child in children:
+            new_pop.append(self.create_actor(genotype=child))
+        self.population = new_pop
 
     def update(self):
-        for actor in self.population:
-            actor.update()
+        self.kernel.step()
+
+    def draw(self):
+        for color, points, position in self.kernel.parts():
+            self.world.draw(color, points, position)
 
-    def stop(self):
+    def stop(self, graph=True):
+        """Ends the run, drawing the brain graph of the best actor unless `graph` is False"""
         self.world.stop()
-        self.population.select_best_fitness().brain_graph()
+        if self.kernel is not None:
+            self.kernel.sync()
+        if self.simulator is not None:
+            self.simulator.close()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+        metrics.disable()
+        if graph:
+            best = self.population.select_best_fitness()
+            self.graph_exporter.export(best, "graph{0}.png".format(best.id))
+        self.graph_exporter.close()
@@ -1,8 +1,12 @@
-import random
-from collections import deque
+import hashlib
+import binascii
+import itertools
+import numpy as np
 from phenotypes.brain import Brain
 from phenotypes.body import Body
 from phenotypes.properties import Properties
+import metrics
+from streams import DEFAULT
 
 
 class Genotype(object):
@@ -19,6 +23,8 @@ class Genotype(object):
     GENE_STEP = 2
     GENE_START = "00"
     GENE_STOP = "FF"
+    REPRODUCTION_POLICIES = (None, "resample", "repair")
+    RESAMPLE_ATTEMPTS = 10
     GENE_DEFINITION = {
         "body": {
             "gene_id": "01",
@@ -48,55 +54,140 @@ class Genotype(object):
         }
     }
 
-    def __init__(self, dna=None):
+    def __init__(self, dna=None, rng=DEFAULT):
         self._genes = None
-        self.dna = dna
-        if self.dna is None:
-            self.generate_dna()
+        self.dna = None
+        if dna is None:
+            self.generate_dna(rng)
+        elif isinstance(dna, list):
+            self.dna = bytearray("".join(dna))
+        else:
+            self.dna = bytearray(dna)
 
     def __str__(self):
-        return "".join(self.dna)
-
-    def generate_dna(self):
-        important_codes = [self.GENE_START, self.GENE_STOP]
-        gene_codes = [x["gene_id"] for x in self.GENE_DEFINITION.values()]
-        self.dna = []
-        while not self.viable:
-            self.dna = [random.choice(self.GENE_CHAR_POOL) for _ in
-                        xrange(random.randint(self.GENE_LENGTH[0], self.GENE_LENGTH[1]))]
-            for _ in xrange(random.randint(self.GENE_IMPORTANT_CODE_NUMBER[0],
-                                           self.GENE_IMPORTANT_CODE_NUMBER[1])):
-                where = random.randint(self.GENE_STEP, len(self.dna) - 2 * self.GENE_STEP)
-                where -= where % self.GENE_STEP
-                code = random.choice(important_codes)
-                self.dna[where:where + self.GENE_STEP] = list(code)
-                if code == self.GENE_START:
-                    self.dna[where + self.GENE_STEP:where + self.GENE_STEP * 2] = list(random.choice(gene_codes))
-            self.extract_genes()
+        return str(self.dna)
+
+    def digest(self):
+        """Content address of the DNA, equal for identical genomes"""
+        return hashlib.sha1(self.dna).digest()
+
+    def pack(self):
+        """Returns the DNA with two symbols per byte, GENE_CHAR_POOL being the hexadecimal digits"""
+        return binascii.unhexlify(self.dna + "0" * (len(self.dna) % 2))
+
+    @classmethod
+    def unpack(cls, data, length):
+        return cls(binascii.hexlify(data).upper()[:length])
+
+    def generate_dna(self, rng=DEFAULT):
+        self.dna = self.random_dna(1, rng)[0]
+        self.repair(rng)
+
+    @classmethod
+    def batch(cls, number, rng=DEFAULT):
+        """Returns `number` new viable genotypes"""
+        if not number:
+            return []
+        genotypes = [cls(dna) for dna in cls.random_dna(number, rng)]
+        for genotype in genotypes:
+            genotype.repair(rng)
+        return genotypes
+
+    @classmethod
+    def random_dna(cls, number, rng=DEFAULT):
+        """Returns `number` random sequences with gene codes scattered over them, drawn as whole arrays
+
+        Each of the GENE_IMPORTANT_CODE_NUMBER codes is a GENE_START followed by a gene id or a GENE_STOP,
+        written at a codon-aligned position over what the previous codes wrote.
+        """
+        if not number:
+            return []
+        step = cls.GENE_STEP
+        lengths = rng.state.randint(cls.GENE_LENGTH[0], cls.GENE_LENGTH[1] + 1, number)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        pool = np.frombuffer(bytearray(cls.GENE_CHAR_POOL), dtype=np.uint8)
+        dna = pool[rng.state.randint(0, len(pool), ends[-1])]
+
+        owners = np.repeat(np.arange(number), rng.state.randint(cls.GENE_IMPORTANT_CODE_NUMBER[0],
+                                                                cls.GENE_IMPORTANT_CODE_NUMBER[1] + 1, number))
+        where = step + (rng.state.random_sample(len(owners)) * (lengths[owners] - 3 * step + 1)).astype(int)
+        where += starts[owners] - where % step
+        codes = np.array([bytearray(cls.GENE_START), bytearray(cls.GENE_STOP)], dtype=np.uint8)
+        gene_codes = np.array([bytearray(x["gene_id"]) for x in cls.GENE_DEFINITION.values()], dtype=np.uint8)
+        is_start = rng.state.randint(0, 2, len(where)) == 0
+        # every code is followed by its gene id, ignored after a GENE_STOP
+        values = np.hstack([codes[np.where(is_start, 0, 1)],
+                            gene_codes[rng.state.randint(0, len(gene_codes), len(where))]])
+        indices = where[:, np.newaxis] + np.arange(2 * step)
+        written = np.repeat(is_start[:, np.newaxis], 2 * step, axis=1)
+        written[:, :step] = True
+        indices = indices[written]
+        values = values[written]
+        # the last write to a symbol is the one that stays
+        _, last = np.unique(indices[::-1], return_index=True)
+        last = len(indices) - 1 - last
+        dna[indices[last]] = values[last]
+        dna = dna.tobytes()
+        return [bytearray(dna[start:end]) for start, end in zip(starts.tolist(), ends.tolist())]
+
+    @classmethod
+    def random_codons(cls, number, rng=DEFAULT):
+        """Returns `number` random codons, none of them being GENE_STOP"""
+        if "_codons" not in cls.__dict__:
+            cls._codons = ["".join(codon) for codon in itertools.product(cls.GENE_CHAR_POOL, repeat=cls.GENE_STEP)
+                           if "".join(codon) != cls.GENE_STOP]
+        return "".join([rng.choice(cls._codons) for _ in xrange(number)])
+
+    def repair(self, rng=DEFAULT):
+        """Makes the DNA viable by inserting a new gene for every phenotype failing its screening
+
+        The genes go where the parsing of the DNA ended, before an unterminated gene if there is one,
+        so that none of the existing genes changes. Returns whether anything was inserted.
+        """
+        self.extract_genes()
+        genes = []
+        # the body keeps the polygon of its last gene, so the body gene is inserted last
+        for name, definition in sorted(self.GENE_DEFINITION.items(), key=lambda item: item[0] == "body"):
+            if not self.screen(name):
+                phenotype = definition["phenotype"]
+                genes.append(self.GENE_START + definition["gene_id"] + phenotype.make_gene(self, definition, rng) +
+                             self.GENE_STOP)
+        if not genes:
+            return False
+        self.dna[self._tail:self._tail] = "".join(genes)
+        self._genes = None
+        metrics.current.count("dna_repairs")
+        return True
+
+    def find_codon(self, codon, start):
+        """Returns the position of the first codon-aligned occurrence of `codon` from `start`, or -1"""
+        position = self.dna.find(codon, start)
+        while position > 0 and position % self.GENE_STEP:
+            position = self.dna.find(codon, position + 1)
+        return position
 
     def extract_genes(self):
         genes = {}
-        dna_seq = deque(self.dna[i:i + self.GENE_STEP]
-                        for i in xrange(0, len(self.dna), self.GENE_STEP))
-        gene = []
-        in_gene_sequence = False
-        while dna_seq:
-            code = "".join(dna_seq.popleft())
-            if code == self.GENE_START and not in_gene_sequence:
-                in_gene_sequence = True
-                gene_id = True
-                gene = []
-            elif code == self.GENE_STOP and in_gene_sequence:
-                # Prevent insertion of empty genes
-                if gene_id is not True and gene:
-                    genes[gene_id].append(gene)
-                in_gene_sequence = False
-            elif in_gene_sequence and gene_id is True:
-                    gene_id = code
-                    if gene_id not in genes:
-                        genes[gene_id] = []
-            elif in_gene_sequence:
-                gene.extend(list(code))
+        # where the expressed part of the DNA ends, what follows is never read
+        self._tail = len(self.dna) - len(self.dna) % self.GENE_STEP
+        position = self.find_codon(self.GENE_START, 0)
+        while position >= 0:
+            gene_start = position + 2 * self.GENE_STEP
+            gene_id = str(self.dna[position + self.GENE_STEP:gene_start])
+            if gene_id == self.GENE_STOP:
+                position = self.find_codon(self.GENE_START, gene_start)
+                continue
+            if gene_id not in genes:
+                genes[gene_id] = []
+            gene_stop = self.find_codon(self.GENE_STOP, gene_start)
+            if gene_stop < 0:
+                self._tail = position
+                break
+            # Prevent insertion of empty genes
+            if gene_stop > gene_start:
+                genes[gene_id].append(str(self.dna[gene_start:gene_stop]))
+            position = self.find_codon(self.GENE_START, gene_stop + self.GENE_STEP)
         self._genes = genes
 
     def get_genes(self):
@@ -115,33 +206,41 @@ class Genotype(object):
     def get_phenotype(self, name):
         return self.GENE_DEFINITION[name]["phenotype"](self, self.get_genes_for_phenotype(name), self.GENE_DEFINITION[name])
 
+    def screen(self, name):
+        """Tells whether the phenotype `name` would be viable, without building it"""
+        definition = self.GENE_DEFINITION[name]
+        genes = self.get_genes_for_phenotype(name)
+        if definition['required'] and not genes:
+            return False
+        return definition["phenotype"].screen(self, genes, definition)
+
     @property
     def viable(self):
         for name in self.GENE_DEFINITION.keys():
-            if self.GENE_DEFINITION[name]['required'] and not self.get_genes_for_phenotype(name):
+            if not self.screen(name):
                 return False
         return True
 
-    def mutate(self):
-        if random.random() < self.GENE_MUTATION_PROB:
-            if random.random() < self.GENE_IF_MUTATION_ADD_PROB:
-                self.dna.insert(random.randint(0, len(self.dna) - 1), random.choice(self.GENE_CHAR_POOL))
-            elif random.random() < self.GENE_IF_MUTATION_NO_ADD_DEL_PROB:
-                del self.dna[random.randint(0, len(self.dna) - 1)]
+    def mutate(self, rng=DEFAULT):
+        if rng.random() < self.GENE_MUTATION_PROB:
+            if rng.random() < self.GENE_IF_MUTATION_ADD_PROB:
+                self.dna.insert(rng.randint(0, len(self.dna) - 1), ord(rng.choice(self.GENE_CHAR_POOL)))
+            elif rng.random() < self.GENE_IF_MUTATION_NO_ADD_DEL_PROB:
+                del self.dna[rng.randint(0, len(self.dna) - 1)]
             else:
-                self.dna[random.randint(0, len(self.dna) - 1)] = random.choice(self.GENE_CHAR_POOL)
+                self.dna[rng.randint(0, len(self.dna) - 1)] = ord(rng.choice(self.GENE_CHAR_POOL))
 
     @classmethod
-    def crossover(cls, father_dna, mother_dna):
-        max_cut = len(min(father_dna, mother_dna)) - 1
-        if random.random() < cls.GENE_CROSSOVER_PROB:
-            cut1 = random.randint(0, max_cut)
-            if random.random() < cls.GENE_IF_CROSSOVER_DOUBLE_PROB:
-                cut2 = random.randint(0, max_cut)
+    def crossover(cls, father_dna, mother_dna, rng=DEFAULT):
+        max_cut = min(len(father_dna), len(mother_dna)) - 1
+        if rng.random() < cls.GENE_CROSSOVER_PROB:
+            cut1 = rng.randint(0, max_cut)
+            if rng.random() < cls.GENE_IF_CROSSOVER_DOUBLE_PROB:
+                cut2 = rng.randint(0, max_cut)
                 if cut2 < cut1:
                     cut1, cut2 = cut2, cut1
-                if random.random() < cls.GENE_IF_CROSSOVER_AND_DOUBLE_UNBALANCED_PROB:
-                    cut3 = random.randint(0, max_cut)
+                if rng.random() < cls.GENE_IF_CROSSOVER_AND_DOUBLE_UNBALANCED_PROB:
+                    cut3 = rng.randint(0, max_cut)
                     if cut3 < cut1:
                         cut1, cut3 = cut3, cut1
                     child_dna = father_dna[:cut1] + mother_dna[cut1:cut2] + father_dna[cut3:]
@@ -150,12 +249,129 @@ class Genotype(object):
             else:
                 child_dna = father_dna[:cut1] + mother_dna[cut1:]
         else:
-            child_dna = random.choice([father_dna, mother_dna])
+            child_dna = bytearray(rng.choice([father_dna, mother_dna]))
         return child_dna
 
     @classmethod
-    def reproduce(cls, father, mother):
-        child_dna = cls.crossover(father.dna, mother.dna)
-        child = cls(child_dna)
-        child.mutate()
-        return child
+    def reproduce(cls, father, mother, policy=None, rng=DEFAULT):
+        """Returns a mutated crossover of the parents
+
+        A non viable child is made again up to RESAMPLE_ATTEMPTS times with the "resample" policy,
+        and receives the genes it misses with "repair" or once the attempts are exhausted.
+        """
+        attempts = cls.RESAMPLE_ATTEMPTS if policy == "resample" else 0
+        while True:
+            child = cls(cls.crossover(father.dna, mother.dna, rng))
+            child.mutate(rng)
+            if policy is None or child.viable:
+                return child
+            if attempts <= 0:
+                child.repair(rng)
+                return child
+            attempts -= 1
+            metrics.current.count("resampled_children")
+
+    @classmethod
+    def reproduce_batch(cls, fathers, mothers, policy=None, rng=DEFAULT):
+        """Returns the children of every pair of parents, as `reproduce` with array operations on the whole batch"""
+        children = [None] * len(fathers)
+        pending = range(len(fathers))
+        attempts = cls.RESAMPLE_ATTEMPTS if policy == "resample" else 0
+        while pending:
+            dna, lengths = cls.crossover_batch(cls.concatenate([fathers[i].dna for i in pending]),
+                                               cls.concatenate([mothers[i].dna for i in pending]), rng)
+            dna, lengths = cls.mutate_batch(dna, lengths, rng)
+            resample = []
+            for i, child_dna in zip(pending, cls.split(dna, lengths)):
+                children[i] = cls(child_dna)
+                if policy is not None and not children[i].viable:
+                    if attempts > 0:
+                        resample.append(i)
+                    else:
+                        children[i].repair(rng)
+            metrics.current.count("resampled_children", len(resample))
+            pending = resample
+            attempts -= 1
+        return children
+
+    @classmethod
+    def concatenate(cls, dnas):
+        """Returns the symbols of all the DNAs in one array, and the length of each DNA"""
+        return (np.frombuffer(bytearray().join(dnas), dtype=np.uint8),
+                np.array([len(dna) for dna in dnas], dtype=int))
+
+    @classmethod
+    def split(cls, symbols, lengths):
+        data = symbols.tobytes()
+        ends = np.cumsum(lengths).tolist()
+        return [bytearray(data[end - length:end]) for end, length in zip(ends, lengths.tolist())]
+
+    @classmethod
+    def crossover_batch(cls, fathers, mothers, rng=DEFAULT):
+        """`crossover` of every pair of concatenated DNAs
+
+        Every child is father[:a] + mother[a:b] + father[c:], the cases of `crossover` only differing
+        in how a, b and c are drawn.
+        """
+        (father, father_length), (mother, mother_length) = fathers, mothers
+        number = len(father_length)
+        state = rng.state
+        cut_range = np.minimum(father_length, mother_length)
+        cut1, cut2, cut3 = (state.random_sample((3, number)) * cut_range).astype(int)
+        crossover = state.random_sample(number) < cls.GENE_CROSSOVER_PROB
+        double = crossover & (state.random_sample(number) < cls.GENE_IF_CROSSOVER_DOUBLE_PROB)
+        unbalanced = double & (state.random_sample(number) < cls.GENE_IF_CROSSOVER_AND_DOUBLE_UNBALANCED_PROB)
+        from_father = state.random_sample(number) < 0.5
+
+        # single point
+        a = cut1
+        b = mother_length
+        c = father_length
+        # double point, the cuts sorted
+        low, high = np.minimum(cut1, cut2), np.maximum(cut1, cut2)
+        a = np.where(double, low, a)
+        b = np.where(double, high, b)
+        c = np.where(double, high, c)
+        # unbalanced double point, the first and third cuts sorted
+        a = np.where(unbalanced, np.minimum(low, cut3), a)
+        c = np.where(unbalanced, np.maximum(low, cut3), c)
+        # no crossover, a copy of either parent
+        a = np.where(crossover, a, np.where(from_father, father_length, 0))
+        b = np.where(crossover, b, np.where(from_father, 0, mother_length))
+        c = np.where(crossover, c, father_length)
+
+        head = np.minimum(a, father_length)
+        middle_start = np.minimum(a, mother_length)
+        middle = np.maximum(np.minimum(b, mother_length) - middle_start, 0)
+        tail_start = np.minimum(c, father_length)
+        father_start = np.cumsum(father_length) - father_length
+        mother_start = np.cumsum(mother_length) - mother_length + len(father)
+        starts = np.column_stack([father_start, mother_start + middle_start, father_start + tail_start]).ravel()
+        ends = starts + np.column_stack([head, middle, father_length - tail_start]).ravel()
+        # the slices are contiguous, copying them is faster than gathering every symbol
+        symbols = np.concatenate([father, mother]).tobytes()
+        child = bytearray().join([symbols[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+        return np.frombuffer(child, dtype=np.uint8), head + middle + father_length - tail_start
+
+    @classmethod
+    def mutate_batch(cls, dna, lengths, rng=DEFAULT):
+        """`mutate` of every concatenated DNA, a mutation either inserting, deleting or replacing one symbol"""
+        number = len(lengths)
+        state = rng.state
+        mutation = state.random_sample(number) < cls.GENE_MUTATION_PROB
+        insert = mutation & (state.random_sample(number) < cls.GENE_IF_MUTATION_ADD_PROB)
+        delete = mutation & ~insert & (state.random_sample(number) < cls.GENE_IF_MUTATION_NO_ADD_DEL_PROB)
+        replace = mutation & ~insert & ~delete & (lengths > 0)
+        delete &= lengths > 0
+        where = np.cumsum(lengths) - lengths + (state.random_sample(number) * lengths).astype(int)
+        pool = np.frombuffer(bytearray(cls.GENE_CHAR_POOL), dtype=np.uint8)
+        symbols = pool[state.randint(0, len(pool), number)]
+
+        dna = dna.copy()
+        dna[where[replace]] = symbols[replace]
+        deleted = where[delete]
+        dna = np.delete(dna, deleted)
+        # each DNA mutates once, the symbols deleted before an insertion belong to the previous ones
+        inserted = where[insert]
+        dna = np.insert(dna, inserted - np.searchsorted(deleted, inserted), symbols[insert])
+        return dna, lengths + insert - delete
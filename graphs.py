@@ -0,0 +1,43 @@
+import multiprocessing
+from phenotypes.brain import write_net
+
+
+class GraphExporter(object):
+    """Queue of brain graphs written by background processes, so that Graphviz never stalls the evolution"""
+    WORKERS = 1
+    FILENAME = "graph{generation}_{rank}_{id}.png"
+
+    def __init__(self, workers=None):
+        self.workers = workers or self.WORKERS
+        self.pool = None
+        self.pending = []
+
+    def export(self, actor, filename):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        # the graph is described here, only its rendering is left to the pool
+        if actor.compiled_brain is not None:
+            edges = actor.compiled_brain.net_edges(actor.brain)
+        else:
+            edges = actor.brain.net_edges()
+        for result in self.pending:
+            if result.ready():
+                result.get()
+        self.pending = [result for result in self.pending if not result.ready()]
+        self.pending.append(self.pool.apply_async(write_net, (edges, filename)))
+
+    def export_best(self, population, generation, number):
+        """Queues the graphs of the `number` best living actors"""
+        best = [actor for actor in population.select_best_fitnesses(number) if not actor.dead]
+        for rank, actor in enumerate(best):
+            self.export(actor, self.FILENAME.format(generation=generation, rank=rank, id=actor.id))
+
+    def close(self):
+        """Waits for the queued graphs to be written"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            for result in self.pending:
+                result.get()
+            self.pool = None
+            self.pending = []
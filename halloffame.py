@@ -0,0 +1,72 @@
+import heapq
+from genotype import Genotype
+
+
+class HallOfFame(object):
+    """Bounded archive of the best distinct genomes of a run, the lowest fitness being the best
+
+    Genomes are told apart by their digest and kept nibble-packed with their fitness and the
+    generation they were met in, never as actors. A heap whose top is the worst entry makes
+    rejecting a genome too bad to enter a single comparison, before the DNA is even hashed.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = {}  # digest: (fitness, generation, packed dna, dna length)
+        self.heap = []  # (-fitness, -generation, digest), entries improved since then are left behind
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, genotype):
+        return genotype.digest() in self.entries
+
+    def __repr__(self):
+        return "<HallOfFame {0}/{1} entries>".format(len(self), self.size)
+
+    @property
+    def worst(self):
+        """Fitness a genome must beat to enter the archive once it is full"""
+        if len(self.entries) < self.size:
+            return float("inf")
+        self.clean()
+        return -self.heap[0][0]
+
+    def add(self, genotype, fitness, generation):
+        """Returns whether the genome entered the archive or improved its entry"""
+        if self.size <= 0 or fitness >= self.worst:
+            return False
+        digest = genotype.digest()
+        entry = self.entries.get(digest)
+        if entry is not None and entry[0] <= fitness:
+            return False
+        self.entries[digest] = (fitness, generation, genotype.pack(), len(genotype.dna))
+        heapq.heappush(self.heap, (-fitness, -generation, digest))
+        if len(self.entries) > self.size:
+            self.clean()
+            del self.entries[heapq.heappop(self.heap)[2]]
+        if len(self.heap) > 2 * self.size:
+            self.heap = [(-fitness_, -generation_, digest_)
+                         for digest_, (fitness_, generation_, _, _) in self.entries.iteritems()]
+            heapq.heapify(self.heap)
+        return True
+
+    def update(self, population, generation):
+        for actor in population:
+            if not actor.dead:
+                self.add(actor.genotype, actor.fitness, generation)
+
+    def clean(self):
+        """Drops the stale items off the top of the heap"""
+        while self.heap:
+            fitness, generation, digest = self.heap[0]
+            entry = self.entries.get(digest)
+            if entry is not None and (-entry[0], -entry[1]) == (fitness, generation):
+                return
+            heapq.heappop(self.heap)
+
+    def best(self, number=None):
+        """Returns the (fitness, generation, genotype) of the `number` best genomes, the best first"""
+        entries = sorted(self.entries.itervalues(), key=lambda entry: (entry[0], entry[1]))[:number]
+        return [(fitness, generation, Genotype.unpack(packed, length))
+                for fitness, generation, packed, length in entries]
@@ -0,0 +1,79 @@
+import random
+import multiprocessing
+from Queue import Empty
+from experiment import Experiment
+from genotype import Genotype
+
+
+def run_island(task):
+    """Evolves one island and returns the fitness and DNA of its best actor
+
+    Every `interval` generations the DNA of the best `migrants` actors is sent to the neighbour
+    islands and whatever they sent in the meantime joins the next generation. Islands never wait
+    for each other.
+    """
+    experiment_class, options, generations, interval, migrants, seed, inbox, outboxes = task
+    experiment = experiment_class(headless=True, seed=seed, **options)
+    experiment.populate()
+    for generation in xrange(1, generations + 1):
+        experiment.simulate(experiment.world.TICKS_PER_GEN - experiment.world.tick)
+        experiment.evaluate()
+        if generation == generations:
+            break
+        if interval and generation % interval == 0:
+            emigrants = [str(actor.genotype) for actor in experiment.population.select_best_fitnesses(migrants)]
+            for outbox in outboxes:
+                outbox.put(emigrants)
+            while True:
+                try:
+                    experiment.immigrate([Genotype(dna) for dna in inbox.get_nowait()])
+                except Empty:
+                    break
+        experiment.breed()
+    best = experiment.population.select_best_fitness()
+    return best.fitness, str(best.genotype)
+
+
+class Archipelago(object):
+    """Independent populations evolving in their own processes and exchanging their best DNA
+
+    `options` are keyword arguments given to the Experiment of every island.
+    """
+    TOPOLOGIES = ("ring", "full")
+
+    def __init__(self, islands=4, interval=10, migrants=5, topology="ring", seed=None, experiment_class=Experiment,
+                 options=None):
+        if topology not in self.TOPOLOGIES:
+            raise ValueError("Unknown topology '{0}', expected one of {1}".format(topology, ", ".join(self.TOPOLOGIES)))
+        self.islands = islands
+        self.interval = interval
+        self.migrants = migrants
+        self.topology = topology
+        self.seed = seed
+        self.experiment_class = experiment_class
+        self.options = options or {}
+
+    def neighbours(self, index):
+        if self.islands < 2:
+            return []
+        if self.topology == "ring":
+            return [(index + 1) % self.islands]
+        return [i for i in xrange(self.islands) if i != index]
+
+    def run(self, generations):
+        """Returns the (fitness, dna) of the best actor of every island"""
+        # every island gets its own stream spawned from the seed of the archipelago
+        seed = self.seed if self.seed is not None else random.randrange(2 ** 31)
+        manager = multiprocessing.Manager()
+        inboxes = [manager.Queue() for _ in xrange(self.islands)]
+        tasks = [(self.experiment_class, self.options, generations, self.interval, self.migrants,
+                  [seed, index],
+                  inboxes[index], [inboxes[i] for i in self.neighbours(index)])
+                 for index in xrange(self.islands)]
+        pool = multiprocessing.Pool(self.islands)
+        try:
+            return pool.map(run_island, tasks)
+        finally:
+            pool.close()
+            pool.join()
+            manager.shutdown()
@@ -0,0 +1,100 @@
+import numpy as np
+from phenotypes.brain import PopulationBrain
+import metrics
+
+
+class PopulationKernel(object):
+    """Steps a whole population at once, keeping positions and speeds as arrays
+
+    Every actor is simulated in each of the scenarios of the world at once: the rows of the arrays
+    hold the live actors of the first scenario, then the same actors in the second one and so on, each
+    copy thinking with its own copy of the brain.
+    """
+    OUTPUT_DIMENSION = 2
+
+    def __init__(self, world, actors):
+        self.world = world
+        self.scenarios = world.scenarios
+        self.actors = list(actors)
+        starts = np.array([actor.position for actor in self.actors], dtype=float).reshape(-1, 2)
+        self.positions = np.tile(starts, (len(self.scenarios), 1))
+        self.alive = np.array([not actor.dead for actor in self.actors], dtype=bool)
+        self.alive_index = np.flatnonzero(self.alive)
+        # rows of the live actors, scenario after scenario
+        self.rows = (np.arange(len(self.scenarios))[:, np.newaxis] * len(self.actors) + self.alive_index).ravel()
+        for i in self.alive_index:
+            self.actors[i].compiled_brain = self.actors[i].brain.compile(world.DT)
+        self.brain = PopulationBrain([self.actors[i].compiled_brain for i in self.alive_index], len(self.scenarios))
+        self.speeds = np.tile([self.actors[i].properties.speed for i in self.alive_index],
+                              len(self.scenarios)).astype(float)
+        self.bounds = np.array([world.SIZE[0] - 5, world.SIZE[1] - 5], dtype=float)
+        self.inside = None  # which live rows are inside an obstacle
+        self.build_shapes()
+
+    def build_shapes(self):
+        owners = []
+        colors = []
+        shapes = []
+        for i in self.alive_index:
+            for color, shape in self.actors[i].body.parts():
+                if color and shape:
+                    owners.append(i)
+                    colors.append(((color + 1) ** 2) - 1)
+                    shapes.append(shape)
+        self.shape_owners = np.array(owners, dtype=int)
+        self.shape_colors = colors
+        self.shape_points = [tuple(shape) for shape in shapes]
+
+    def split(self, rows):
+        """Yields the world of every scenario with the part of the live `rows` simulated in it"""
+        count = len(self.alive_index)
+        for index, world in enumerate(self.scenarios):
+            yield world, rows[index * count:(index + 1) * count]
+
+    def target_distances(self, positions):
+        """Distance of each of the live rows' positions to the nearest target of its scenario"""
+        return np.concatenate([world.targets.nearest(part)[1] for world, part in self.split(positions)])
+
+    def directions(self, positions):
+        vectors = np.concatenate([world.nearest_targets(part) for world, part in self.split(positions)]) - positions
+        lengths = np.sqrt(vectors[:, 0] ** 2 + vectors[:, 1] ** 2)
+        # an actor sitting exactly on the target has no direction to go
+        lengths[lengths == 0] = np.inf
+        return vectors / lengths[:, np.newaxis]
+
+    def think(self, directions):
+        with metrics.current.timer("brain"):
+            return self.brain.think(directions, self.OUTPUT_DIMENSION)
+
+    def step(self):
+        if not len(self.rows):
+            return
+        positions = self.positions[self.rows]
+        moves = self.think(self.directions(positions))
+        moved = positions + moves * self.world.tslf / 10 * self.speeds[:, np.newaxis]
+        np.minimum(np.maximum(moved, 0), self.bounds, out=moved)
+        if any(len(world.obstacles) for world in self.scenarios):
+            # moves into an obstacle are cancelled, moves out of one are not
+            if self.inside is None:
+                self.inside = np.concatenate([world.blocked(part) for world, part in self.split(positions)])
+            inside = np.concatenate([world.blocked(part) for world, part in self.split(moved)])
+            stopped = inside & ~self.inside
+            moved[stopped] = positions[stopped]
+            self.inside &= inside
+        self.positions[self.rows] = moved
+
+    def parts(self):
+        """Returns the (color, points, position) of every body part in the first scenario
+
+        Points are relative to the position.
+        """
+        return zip(self.shape_colors, self.shape_points, self.positions[self.shape_owners].tolist())
+
+    def sync(self):
+        """Writes the array state back to the actors, with their position in every scenario when there are several"""
+        positions = [tuple(position) for position in self.positions.tolist()]
+        for i, actor in enumerate(self.actors):
+            actor.position = positions[i]
+            if len(self.scenarios) > 1:
+                actor.positions = positions[i::len(self.actors)]
+        self.brain.sync()
@@ -1,5 +1,61 @@
+import argparse
 from experiment import Experiment
+from islands import Archipelago
+import metrics
 
 if __name__ == "__main__":
-    e = Experiment()
-    e.start()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", action="store_true", help="run without a display, as fast as possible")
+    parser.add_argument("--generations", type=int, default=None, help="stop after this many generations")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random number generator")
+    parser.add_argument("--workers", type=int, default=1, help="processes sharing each generation, headless only")
+    parser.add_argument("--checkpoint", default=None, help="file to which every evaluated generation is appended")
+    parser.add_argument("--resume", action="store_true", help="continue from the last generation of the checkpoint")
+    parser.add_argument("--resume-generation", type=int, default=None, help="continue from this generation instead")
+    parser.add_argument("--render-fps", type=int, default=None, help="frames drawn per second by the window")
+    parser.add_argument("--targets", type=int, default=None, help="targets placed in the world, actors head for the nearest")
+    parser.add_argument("--obstacles", type=int, default=None, help="obstacles placed in the world, blocking the actors")
+    parser.add_argument("--scenarios", type=int, default=None,
+                        help="target layouts every actor is simulated in at once, its fitness averaging them")
+    parser.add_argument("--multi-objective", action="store_true",
+                        help="rank actors by Pareto front of their objectives instead of their summed fitness")
+    parser.add_argument("--steady-state", type=int, default=0, metavar="COHORT",
+                        help="evolve without generations, replacing the worst actors by cohorts of that size, headless only")
+    parser.add_argument("--hall-of-fame", type=int, default=0, metavar="SIZE",
+                        help="keep the best distinct genomes of the whole run and print them at the end")
+    parser.add_argument("--early-stop", action="store_true",
+                        help="end a generation as soon as its actors stopped moving or stopped getting closer")
+    parser.add_argument("--graphs", type=int, default=0, help="brain graphs of the best actors drawn every generation")
+    parser.add_argument("--metrics", default=None, help="file to which per generation timings and counters are exported")
+    parser.add_argument("--metrics-format", choices=sorted(metrics.EXPORTERS), default="jsonl")
+    parser.add_argument("--islands", type=int, default=0, help="evolve that many populations in parallel, headless only")
+    parser.add_argument("--migration-interval", type=int, default=10, help="generations between two island migrations")
+    parser.add_argument("--migrants", type=int, default=5, help="best actors sent to the neighbour islands")
+    parser.add_argument("--topology", choices=Archipelago.TOPOLOGIES, default="ring", help="which islands are neighbours")
+    args = parser.parse_args()
+    if (args.resume or args.resume_generation is not None) and not args.checkpoint:
+        parser.error("--resume and --resume-generation need --checkpoint")
+    if args.islands:
+        # islands run in pool processes and return only their best actor
+        for flag, value in (("--workers", args.workers > 1), ("--checkpoint", args.checkpoint),
+                            ("--metrics", args.metrics), ("--steady-state", args.steady_state),
+                            ("--hall-of-fame", args.hall_of_fame), ("--graphs", args.graphs)):
+            if value:
+                parser.error("{0} can't be used with --islands".format(flag))
+        archipelago = Archipelago(args.islands, args.migration_interval, args.migrants, args.topology, args.seed,
+                                  options=dict(targets=args.targets, obstacles=args.obstacles, scenarios=args.scenarios,
+                                               multi_objective=args.multi_objective, early_stop=args.early_stop))
+        for island, (fitness, dna) in enumerate(archipelago.run(args.generations or 100)):
+            print("Island {0}: {1} {2}".format(island, fitness, dna))
+    else:
+        e = Experiment(headless=args.headless, seed=args.seed, workers=args.workers, checkpoint=args.checkpoint,
+                       metrics_path=args.metrics, metrics_format=args.metrics_format,
+                       render_fps=args.render_fps, graphs=args.graphs,
+                       multi_objective=args.multi_objective, steady_state=args.steady_state,
+                       targets=args.targets, obstacles=args.obstacles, hall_of_fame=args.hall_of_fame,
+                       early_stop=args.early_stop, scenarios=args.scenarios)
+        if args.resume or args.resume_generation is not None:
+            e.resume(args.resume_generation)
+        e.start(generations=args.generations)
+        for fitness, generation, genotype in e.hall_of_fame.best():
+            print("{0} {1} {2}".format(fitness, generation, genotype))
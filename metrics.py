@@ -0,0 +1,149 @@
+"""Per generation timers and counters of the hot paths.
+
+Instrumented code reports to `metrics.current`, which does nothing until `enable` is called, and the
+experiment exports and resets the values once per generation.
+"""
+import os
+import json
+import timeit
+from collections import defaultdict
+
+
+class Timer(object):
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.timers[self.name] += timeit.default_timer() - self.start
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Disabled(object):
+    enabled = False
+    null_timer = NullTimer()
+
+    def timer(self, name):
+        return self.null_timer
+
+    def count(self, name, value=1):
+        pass
+
+    def export(self, generation):
+        return None
+
+
+class Recorder(object):
+    enabled = True
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.last_export = timeit.default_timer()
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def export(self, generation):
+        now = timeit.default_timer()
+        sample = {"generation": generation, "seconds": now - self.last_export,
+                  "phases": dict(self.timers), "counters": dict(self.counters)}
+        if self.counters["brains"]:
+            sample["counters"]["synapses_per_brain"] = float(self.counters["synapses"]) / self.counters["brains"]
+        self.exporter.write(sample)
+        self.timers.clear()
+        self.counters.clear()
+        self.last_export = now
+        return sample
+
+
+class JsonLinesExporter(object):
+    """Appends one JSON object per generation"""
+
+    def __init__(self, path):
+        self.output = open(path, "a")
+
+    def write(self, sample):
+        self.output.write(json.dumps(sample, sort_keys=True) + "\n")
+        self.output.flush()
+
+    def close(self):
+        self.output.close()
+
+
+class PrometheusExporter(object):
+    """Rewrites the values of the last generation in the Prometheus text format, for a textfile collector"""
+    PREFIX = "geneticai"
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, sample):
+        lines = ["# TYPE {0}_generation gauge".format(self.PREFIX),
+                 "{0}_generation {1}".format(self.PREFIX, sample["generation"]),
+                 "# TYPE {0}_generation_seconds gauge".format(self.PREFIX),
+                 "{0}_generation_seconds {1!r}".format(self.PREFIX, sample["seconds"]),
+                 "# TYPE {0}_phase_seconds gauge".format(self.PREFIX)]
+        for phase, seconds in sorted(sample["phases"].items()):
+            lines.append('{0}_phase_seconds{{phase="{1}"}} {2!r}'.format(self.PREFIX, phase, seconds))
+        for name, value in sorted(sample["counters"].items()):
+            lines.append("# TYPE {0}_{1} gauge".format(self.PREFIX, name))
+            lines.append("{0}_{1} {2!r}".format(self.PREFIX, name, value))
+        with open(self.path + ".tmp", "w") as output:
+            output.write("\n".join(lines) + "\n")
+        # renamed so that a scrape never reads a half written file
+        os.rename(self.path + ".tmp", self.path)
+
+    def close(self):
+        pass
+
+
+class NullExporter(object):
+    """Drops the samples, for a recorder only read in memory"""
+
+    def write(self, sample):
+        pass
+
+    def close(self):
+        pass
+
+
+EXPORTERS = {"jsonl": JsonLinesExporter, "prometheus": PrometheusExporter}
+current = Disabled()
+
+
+def enable(path, format="jsonl"):
+    global current
+    current = Recorder(EXPORTERS[format](path))
+    return current
+
+
+def record():
+    """Enables the recorder without exporting anything, if it isn't already"""
+    global current
+    if not current.enabled:
+        current = Recorder(NullExporter())
+    return current
+
+
+def disable():
+    global current
+    if current.enabled:
+        current.exporter.close()
+    current = Disabled()
@@ -0,0 +1,89 @@
+import multiprocessing
+from collections import OrderedDict
+from world import World
+from actor import Actor
+from genotype import Genotype
+from kernel import PopulationKernel
+from cache import LRUCache
+from convergence import Convergence
+
+# lives as long as the worker process, so genomes met in earlier generations are not decoded again
+PHENOTYPE_CACHE = LRUCache(10000)
+
+
+def simulate_shard(task):
+    """Simulates a shard of a generation and returns the fitness and final positions of its actors, along with
+    the convergence rule that ended the shard early and the number of ticks it ran
+
+    Only the DNA and the few values needed to rebuild the actors travel between processes.
+    """
+    experiment_class, layouts, ticks, early_stop, actors = task
+    world = World(None)
+    world.set_layouts(layouts)
+    shard = [Actor(world, id_, experiment_class.evaluate_fitness, genotype=Genotype(dna), position=position,
+                   phenotype_cache=PHENOTYPE_CACHE)
+             for id_, dna, position in actors]
+    kernel = PopulationKernel(world, shard)
+    convergence = Convergence() if early_stop else None
+    rule = None
+    ran = 0
+    if not len(kernel.alive_index):
+        # no actor can move, the outcome is known without a step
+        rule = "no_live_actors" if convergence is not None and ticks > 0 else None
+        ticks = 0
+    while ran < ticks and rule is None:
+        kernel.step()
+        ran += 1
+        if convergence is not None:
+            rule = convergence.update(kernel)
+    kernel.sync()
+    return [(actor.fitness, actor.position, actor.positions) for actor in shard], rule, ran
+
+
+class ParallelSimulator(object):
+    """Shares the simulation of every generation between a pool of worker processes"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers)
+
+    def shards(self, actors):
+        size = -(-len(actors) // self.workers)
+        return [actors[i:i + size] for i in xrange(0, len(actors), size)]
+
+    def simulate(self, experiment, ticks):
+        if ticks <= 0:
+            return
+        # identical actors have identical outcomes, only one of them is simulated
+        clones = OrderedDict()
+        for actor in experiment.population:
+            clones.setdefault((str(actor.genotype), actor.position), []).append(actor)
+        actors = [(group[0].id, dna, position) for (dna, position), group in clones.items()]
+        tasks = [(type(experiment), experiment.world.layouts(), ticks, experiment.early_stop, shard)
+                 for shard in self.shards(actors)]
+        shards = self.pool.map(simulate_shard, tasks)
+        results = [result for shard, _, _ in shards for result in shard]
+        # the generation lasted as long as its longest shard
+        _, rule, ran = max(shards, key=lambda shard: shard[2])
+        if rule is not None:
+            experiment.end_episode(rule, ticks - ran)
+        for group, (fitness, position, positions) in zip(clones.values(), results):
+            for actor in group:
+                actor.position = position
+                actor.positions = positions
+                actor.fitness = fitness
+        experiment.population.sorted = False
+        experiment.world.tick += ticks
+
+    def submit(self, experiment, world, actors, ticks):
+        """Starts simulating `actors` in the layout of `world` as a task of its own
+
+        The returned result's get() gives what simulate_shard returns.
+        """
+        actors = [(actor.id, str(actor.genotype), actor.position) for actor in actors]
+        return self.pool.apply_async(simulate_shard, ((type(experiment), world.layouts(), ticks, experiment.early_stop,
+                                                       actors),))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,86 @@
+"""Pareto ranking of objective vectors, all objectives being minimized (NSGA-II)."""
+import numpy as np
+
+BLOCK = 256  # points whose fronts are searched together
+
+
+def dominated(points, members):
+    """Tells for every point whether one of the members is lower or equal on every objective
+
+    `members` holds one objective per row, so that the comparisons run on contiguous memory.
+    """
+    result = np.zeros(len(points), dtype=bool)
+    for start in xrange(0, members.shape[1], BLOCK):
+        below = members[0, np.newaxis, start:start + BLOCK] <= points[:, 0, np.newaxis]
+        for objective in xrange(1, len(members)):
+            below &= members[objective, np.newaxis, start:start + BLOCK] <= points[:, objective, np.newaxis]
+        result |= below.any(axis=1)
+    return result
+
+
+def fronts(objectives):
+    """Returns the front of every row of `objectives`, 0 for the non-dominated rows
+
+    Efficient non-dominated sort with binary search: the distinct rows are visited in lexicographic
+    order, so that every row comes after the rows dominating it, and the fronts of a block of rows
+    are binary searched together. A row dominated by a member of a front is dominated by a member
+    of every better front, so the row belongs to the first front none of whose members dominates it.
+    """
+    values, inverse = np.unique(objectives, axis=0, return_inverse=True)
+    front = np.empty(len(values), dtype=int)
+    members = []
+    for start in xrange(0, len(values), BLOCK):
+        block = values[start:start + BLOCK]
+        low = np.zeros(len(block), dtype=int)
+        high = np.full(len(block), len(members), dtype=int)
+        searching = low < high
+        while searching.any():
+            middle = (low + high) // 2
+            for k in np.unique(middle[searching]):
+                points = np.flatnonzero(searching & (middle == k))
+                found = dominated(block[points], members[k])
+                low[points[found]] = k + 1
+                high[points[~found]] = k
+            searching = low < high
+        # rows of the block also dominate the rows following them in the block
+        inner = (block[np.newaxis, :, :] <= block[:, np.newaxis, :]).all(axis=2)
+        np.fill_diagonal(inner, False)
+        for i in np.flatnonzero(inner.any(axis=1)):
+            low[i] = max(low[i], low[inner[i]].max() + 1)
+        front[start:start + len(block)] = low
+        for k in np.unique(low):
+            rows = block[low == k].T
+            if k == len(members):
+                members.append(rows)
+            else:
+                members[k] = np.concatenate([members[k], rows], axis=1)
+    return front[inverse.ravel()]
+
+
+def crowding_distances(objectives, front):
+    """Returns the NSGA-II crowding distance of every row within its front, infinite on the boundaries"""
+    distance = np.zeros(len(objectives))
+    for column in objectives.T:
+        order = np.lexsort((column, front))
+        values = column[order]
+        fronts_ = front[order]
+        first = np.r_[True, fronts_[1:] != fronts_[:-1]]
+        last = np.r_[fronts_[1:] != fronts_[:-1], True]
+        # extent of the front of every row, taken between its first and last row
+        starts = np.flatnonzero(first)
+        ends = np.flatnonzero(last)
+        extent = np.repeat(values[ends] - values[starts], ends - starts + 1)
+        gap = np.zeros(len(values))
+        gap[1:-1] = values[2:] - values[:-2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            contribution = np.where(extent > 0, gap / extent, 0.0)
+        contribution[first | last] = np.inf
+        distance[order] += contribution
+    return distance
+
+
+def rank(objectives):
+    """Returns the indices of the rows from the best to the worst: by front, then most isolated first"""
+    objectives = np.asarray(objectives, dtype=float).reshape(len(objectives), -1)
+    front = fronts(objectives)
+    return np.lexsort((-crowding_distances(objectives, front), front))
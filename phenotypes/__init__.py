@@ -13,3 +13,13 @@ class Phenotype(object):
     @property
     def viable(self):
         return True
+
+    @classmethod
+    def screen(cls, genotype, genes, definition):
+        """Tells from the genes alone, without building the phenotype, whether it would be viable"""
+        return True
+
+    @classmethod
+    def make_gene(cls, genotype, definition, rng):
+        """Returns the content of a gene passing `screen`"""
+        return ""
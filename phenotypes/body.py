@@ -23,3 +23,16 @@ class Body(Phenotype):
         if self.color is None or self.polygon is None:
             return False
         return True
+
+    @classmethod
+    def screen(cls, genotype, genes, definition):
+        # the polygon comes from the last gene only, and a gene long enough for it also holds a color
+        if not genes:
+            return False
+        return len(xrange(definition["color_length"], len(genes[-1]) - definition["apex_length"],
+                          definition["apex_length"])) >= 3
+
+    @classmethod
+    def make_gene(cls, genotype, definition, rng):
+        length = definition["color_length"] + rng.randint(3, 6) * definition["apex_length"] + 1
+        return genotype.random_codons(-(-length // genotype.GENE_STEP), rng)
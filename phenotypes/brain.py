@@ -1,18 +1,25 @@
+import copy
 import math
-import pydot
+import numpy as np
 from time import time
+import metrics
 
 from . import Phenotype
 
 
 class Brain(Phenotype):
+    TICK_LENGTH = 1000.0 / 30  # milliseconds of simulation per think, matches World.DT
+
     def __init__(self, *args, **kwargs):
         super(Brain, self).__init__(*args, **kwargs)
+        self.tick = 0
+        self._compiled = None
         self.connection_code_length = 2 * self.neuron_id_code_length + self.connection_weight_code_length
         self.inputs = []
         self.hiddens = []
         self.outputs = []
         self.connections = []
+        self.neurons = {}
         self.gene_parser()
 
     def gene_parser(self):
@@ -29,55 +36,58 @@ class Brain(Phenotype):
                 out_neuron_id = int(code[self.neuron_id_code_length + self.connection_weight_code_length:], self.genotype.GENE_BASE)
                 connections.append((in_neuron_id, weight, out_neuron_id))
         self.net_builder(connections)
+        metrics.current.count("brains")
+        metrics.current.count("synapses", len(self.connections))
 
     def net_builder(self, connections):
         ins = []
         outs = []
         tree = {}
-
-        def path_checker(path, check):
-            if check in path:
-                raise RuntimeError
-            else:
-                path.append(check)
-                if check in tree:
-                    for con in [x["to"] for x in tree[check]]:
-                        path_checker(list(path), con)
+        order = TopologicalOrder()
 
         for connection in connections:
-            try:
-                path_checker([connection[0]], connection[2])
-            except RuntimeError:
+            if not order.add_edge(connection[0], connection[2]):
+                metrics.current.count("cycle_rejections")
                 continue
             if connection[0] not in tree:
                 tree[connection[0]] = []
             tree[connection[0]].append({"to": connection[2], "weight": connection[1]})
             ins.append(connection[0])
             outs.append(connection[2])
-        inputs = list(set(ins) - set(outs))
-        outputs = list(set(outs) - set(ins))
+        inputs = set(ins) - set(outs)
+        outputs = set(outs) - set(ins)
 
-        def tree_builder(neuron_id):
+        def neuron_builder(neuron_id):
             neuron = self.get_neuron(neuron_id)
             if neuron is None:
                 if neuron_id in inputs:
-                    neuron = InputNeuron(neuron_id)
+                    neuron = InputNeuron(neuron_id, clock=self.clock)
                     self.inputs.append(neuron)
                 elif neuron_id in outputs:
-                    neuron = OutputNeuron(neuron_id)
+                    neuron = OutputNeuron(neuron_id, clock=self.clock)
                     self.outputs.append(neuron)
                 else:
-                    neuron = Neuron(neuron_id)
+                    neuron = Neuron(neuron_id, clock=self.clock)
                     self.hiddens.append(neuron)
-            if neuron_id in tree:
-                for connection in tree.pop(neuron_id):
-                    synapse = Synapse(connection["weight"], neuron, tree_builder(connection["to"]))
+                self.neurons[neuron_id] = neuron
+            return neuron, iter(tree.pop(neuron_id, [])), None
+
+        # depth first from every input, a synapse being created once the neuron it aims at is complete
+        for neuron_id in list(inputs):
+            stack = [neuron_builder(neuron_id)]
+            while stack:
+                neuron, pending, _ = stack[-1]
+                connection = next(pending, None)
+                if connection is not None:
+                    stack[-1] = (neuron, pending, connection)
+                    stack.append(neuron_builder(connection["to"]))
+                    continue
+                stack.pop()
+                if stack:
+                    origin, _, connection = stack[-1]
+                    synapse = Synapse(connection["weight"], origin, neuron)
                     self.connections.append(synapse)
-                    neuron.add_connection(synapse)
-            return neuron
-
-        for neuron_id in inputs:
-            tree_builder(neuron_id)
+                    origin.add_connection(synapse)
 
     @property
     def viable(self):
@@ -85,22 +95,42 @@ class Brain(Phenotype):
             return False
         return True
 
+    @classmethod
+    def screen(cls, genotype, genes, definition):
+        # the first connection between two different neurons always passes the cycle check
+        id_length = definition["neuron_id_code_length"]
+        code_length = 2 * id_length + definition["connection_weight_code_length"]
+        for gene in genes:
+            for i in xrange(0, len(gene) - code_length + 1, code_length):
+                if gene[i:i + id_length] != gene[i + code_length - id_length:i + code_length]:
+                    return True
+        return False
+
+    @classmethod
+    def make_gene(cls, genotype, definition, rng):
+        id_length = definition["neuron_id_code_length"]
+        code_length = 2 * id_length + definition["connection_weight_code_length"]
+        gene = genotype.random_codons(-(-code_length // genotype.GENE_STEP), rng)
+        while gene[:id_length] == gene[code_length - id_length:code_length]:
+            gene = genotype.random_codons(-(-code_length // genotype.GENE_STEP), rng)
+        return gene
+
     def get_neuron(self, neuron_id):
-        try:
-            index = self.hiddens.index(neuron_id)
-            return self.hiddens[index]
-        except ValueError:
-            try:
-                index = self.inputs.index(neuron_id)
-                return self.inputs[index]
-            except ValueError:
-                try:
-                    index = self.outputs.index(neuron_id)
-                    return self.outputs[index]
-                except ValueError:
-                    return None
+        return self.neurons.get(neuron_id)
+
+    def clock(self):
+        """Simulation time in seconds, driven by the number of thinks instead of the wall clock"""
+        return self.tick * self.TICK_LENGTH / 1000.0
+
+    def compile(self, tick_length=None):
+        """Returns a compiled copy of the network, the layout being computed once per brain"""
+        tick_length = tick_length or self.TICK_LENGTH
+        if self._compiled is None or self._compiled.tick_length != tick_length:
+            self._compiled = CompiledBrain(self, tick_length)
+        return self._compiled.copy()
 
     def think(self, inputs, output_dimension):
+        self.tick += 1
         for value, neuron in zip(inputs, self.inputs):
             neuron.activate(value)
         results = []
@@ -118,46 +148,127 @@ class Brain(Phenotype):
         output_filler[:len(results)] = results[:output_dimension]
         return output_filler
 
-    def draw_net(self, filename):
-        graph = pydot.Dot(graph_type='digraph')
-        graph.set_rankdir('LR')
-        drawn = []
+    def net_edges(self, weights=None):
+        """Returns the (origin, origin color, aim, aim color, weight) of every synapse, from the inputs
+
+        `weights` maps the id of synapses to the weight to show instead of theirs.
+        """
+        weights = weights or {}
+        edges = []
+        expanded = set()
 
         def add_edges(neurons, level=0):
             for neuron in neurons:
+                if neuron.id in expanded:
+                    continue
+                expanded.add(neuron.id)
                 for synapse in neuron.connections:
-                    if synapse in drawn:
-                        continue
-                    else:
-                        drawn.append(synapse)
                     if level == 0:
-                        start_node = pydot.Node(neuron.id, style="filled", fillcolor="#77DD77")
+                        start_color = "#77DD77"
                     else:
-                        start_node = pydot.Node(neuron.id, style="filled", fillcolor="#AEC6CF")
+                        start_color = "#AEC6CF"
                     if len(synapse.aim.connections) > 0:
-                        end_node = pydot.Node(synapse.aim.id, style="filled", fillcolor="#AEC6CF")
+                        end_color = "#AEC6CF"
                     else:
-                        end_node = pydot.Node(synapse.aim.id, style="filled", fillcolor="#FF6961")
-                    graph.add_node(start_node)
-                    graph.add_node(end_node)
-                    graph.add_edge(pydot.Edge(start_node, end_node, label=str(synapse.weight)))
+                        end_color = "#FF6961"
+                    edges.append((neuron.id, start_color, synapse.aim.id, end_color,
+                                  weights.get(id(synapse), synapse.weight)))
                 aims = [c.aim for c in neuron.connections]
                 add_edges(aims, level + 1)
 
         add_edges(self.inputs)
-        graph.write_png(filename)
+        return edges
+
+    def draw_net(self, filename):
+        write_net(self.net_edges(), filename)
+
+
+def write_net(edges, filename):
+    """Renders the edges of `Brain.net_edges` to a png with Graphviz"""
+    # imported on first use, runs that never draw don't need pydot nor graphviz
+    import pydot
+    graph = pydot.Dot(graph_type='digraph')
+    graph.set_rankdir('LR')
+    for start, start_color, end, end_color, weight in edges:
+        start_node = pydot.Node(start, style="filled", fillcolor=start_color)
+        end_node = pydot.Node(end, style="filled", fillcolor=end_color)
+        graph.add_node(start_node)
+        graph.add_node(end_node)
+        graph.add_edge(pydot.Edge(start_node, end_node, label=str(weight)))
+    graph.write_png(filename)
+
+
+class TopologicalOrder(object):
+    """Topological order of a growing graph, refusing the edges that would close a cycle.
+
+    Pearce and Kelly's dynamic algorithm: an edge that agrees with the current order is accepted
+    right away, otherwise only the neurons placed between its two ends are searched and reordered.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.children = {}
+        self.parents = {}
+        self.first = 0
+        self.last = 0
+
+    def add_node(self, node, first):
+        if node not in self.index:
+            # a new node has no edge yet and can go anywhere, ends of the order need no reordering
+            if first:
+                self.first -= 1
+                self.index[node] = self.first
+            else:
+                self.last += 1
+                self.index[node] = self.last
+            self.children[node] = set()
+            self.parents[node] = set()
+
+    def add_edge(self, origin, aim):
+        """Adds the edge and returns True unless it would create a cycle"""
+        if origin == aim:
+            return False
+        self.add_node(origin, True)
+        self.add_node(aim, False)
+        lower, upper = self.index[aim], self.index[origin]
+        if lower < upper:
+            forward = self.search(aim, self.children, lambda node: self.index[node] <= upper)
+            if origin in forward:
+                return False
+            backward = self.search(origin, self.parents, lambda node: self.index[node] >= lower)
+            self.reorder(backward, forward)
+        self.children[origin].add(aim)
+        self.parents[aim].add(origin)
+        return True
+
+    def search(self, start, edges, bounded):
+        visited = set([start])
+        stack = [start]
+        while stack:
+            for node in edges[stack.pop()]:
+                if node not in visited and bounded(node):
+                    visited.add(node)
+                    stack.append(node)
+        return visited
+
+    def reorder(self, backward, forward):
+        key = self.index.get
+        nodes = sorted(backward, key=key) + sorted(forward, key=key)
+        for node, index in zip(nodes, sorted(self.index[node] for node in nodes)):
+            self.index[node] = index
 
 
 class Neuron(object):
     TRESHOLD_LEVEL = 0.5
     DECAY_RATE = 4
 
-    def __init__(self, id_, connections=None):
+    def __init__(self, id_, connections=None, clock=time):
         self.id = id_
         self.connections = connections or []
         self.value = 0.0
         self.has_fired = False
-        self.last_activation = time()
+        self.clock = clock
+        self.last_activation = clock()
 
     def __eq__(self, other):
         if isinstance(other, Neuron):
@@ -171,7 +282,7 @@ class Neuron(object):
         self.connections.append(connection)
 
     def activate(self, value):
-        activation_time = time()
+        activation_time = self.clock()
         self.value *= self.exp_decay((activation_time - self.last_activation) * 1000)
         self.last_activation = activation_time
         self.value += value
@@ -237,3 +348,249 @@ class Synapse(object):
 
     def reset(self):
         self.used = False
+
+
+class CompiledBrain(object):
+    """Flat form of a Brain network: synapses sorted by the depth of the neuron they aim at.
+
+    Neurons are laid out as inputs, hiddens then outputs, so a think is a single pass over the
+    synapse list, checking the threshold of each depth's hidden neurons once all their inputs are in.
+    A neuron sums what it receives during a tick before firing, which is what the depth-first
+    propagation of the object graph computes as long as a neuron does not cross its threshold
+    halfway through its inputs.
+    """
+
+    def __init__(self, brain, tick_length):
+        neurons = brain.inputs + brain.hiddens + brain.outputs
+        index = dict((id(neuron), i) for i, neuron in enumerate(neurons))
+        self.size = len(neurons)
+        self.input_count = len(brain.inputs)
+        self.output_index = range(self.input_count + len(brain.hiddens), self.size)
+        self.tick_length = tick_length
+        self.threshold = Neuron.TRESHOLD_LEVEL
+        self.decay_rate = Neuron.DECAY_RATE
+        self.weight_alteration = Synapse.WEIGHT_ALTERATION_FACTOR
+
+        src = [index[id(synapse.origin)] for synapse in brain.connections]
+        dst = [index[id(synapse.aim)] for synapse in brain.connections]
+        self.depth = self.depths(src, dst)
+        order = sorted(xrange(len(dst)), key=lambda i: self.depth[dst[i]])
+        self.synapses = [brain.connections[i] for i in order]
+        self.src = [src[i] for i in order]
+        self.dst = [dst[i] for i in order]
+        self.weight = [synapse.weight for synapse in self.synapses]
+        self.used = [synapse.used for synapse in self.synapses]
+        self.excitatory = [weight >= 0.0 for weight in self.weight]
+        self.is_output = [False] * (self.size - len(self.output_index)) + [True] * len(self.output_index)
+        self.levels = []
+        start = 0
+        for end in xrange(1, len(self.dst) + 1):
+            if end == len(self.dst) or self.depth[self.dst[end]] != self.depth[self.dst[start]]:
+                hiddens = sorted(set(d for d in self.dst[start:end] if not self.is_output[d]))
+                self.levels.append((start, end, hiddens))
+                start = end
+
+        self.tick = brain.tick
+        self.value = [neuron.value for neuron in neurons]
+        self.last_tick = [self.tick] * self.size
+
+    def depths(self, src, dst):
+        """Longest distance of every neuron from an input, computed in topological order"""
+        depth = [0] * self.size
+        remaining = [0] * self.size
+        outgoing = [[] for _ in xrange(self.size)]
+        for s, d in zip(src, dst):
+            outgoing[s].append(d)
+            remaining[d] += 1
+        frontier = [neuron for neuron in xrange(self.size) if not remaining[neuron]]
+        while frontier:
+            neuron = frontier.pop()
+            for aim in outgoing[neuron]:
+                depth[aim] = max(depth[aim], depth[neuron] + 1)
+                remaining[aim] -= 1
+                if not remaining[aim]:
+                    frontier.append(aim)
+        return depth
+
+    def think(self, inputs, output_dimension):
+        self.tick += 1
+        src, dst, weight, used = self.src, self.dst, self.weight, self.used
+        emitted = [1.0] * self.size
+        firing = [False] * self.size
+        received = [0.0] * self.size
+        touched = [False] * self.size
+        for i in xrange(min(len(inputs), self.input_count)):
+            emitted[i] = inputs[i]
+            firing[i] = True
+        for start, end, hiddens in self.levels:
+            for i in xrange(start, end):
+                if firing[src[i]]:
+                    received[dst[i]] += emitted[src[i]] * weight[i]
+                    touched[dst[i]] = True
+            for neuron in hiddens:
+                if touched[neuron]:
+                    elapsed = (self.tick - self.last_tick[neuron]) * self.tick_length
+                    self.value[neuron] = self.value[neuron] * math.exp(-elapsed * self.decay_rate) + received[neuron]
+                    self.last_tick[neuron] = self.tick
+                    firing[neuron] = self.value[neuron] > self.threshold
+        for i in xrange(len(weight)):
+            if firing[src[i]]:
+                # a synapse is used when it made its aim fire, inverted for inhibitory ones
+                used[i] = (firing[dst[i]] and not self.is_output[dst[i]]) == self.excitatory[i]
+            if used[i]:
+                weight[i] += weight[i] * self.weight_alteration
+            else:
+                weight[i] -= weight[i] * self.weight_alteration
+        results = [received[neuron] for neuron in self.output_index]
+        output_filler = [0.0 for _ in range(output_dimension)]
+        output_filler[:len(results)] = results[:output_dimension]
+        return output_filler
+
+    def copy(self):
+        """Returns a brain sharing this one's layout with its own copy of the learning state"""
+        compiled = copy.copy(self)
+        compiled.weight = list(self.weight)
+        compiled.used = list(self.used)
+        compiled.value = list(self.value)
+        compiled.last_tick = list(self.last_tick)
+        return compiled
+
+    def net_edges(self, brain):
+        """Returns brain.net_edges with the weights learned by this copy, leaving the shared brain as it is"""
+        return brain.net_edges(dict((id(synapse), weight) for synapse, weight in zip(self.synapses, self.weight)))
+
+
+class PopulationBrain(object):
+    """Compiled brains of a whole population packed into one block-diagonal network.
+
+    Row `i` of the inputs and outputs belongs to the `i`th brain. The synapses of every brain are
+    concatenated and sorted by depth, so a think costs a few array operations per depth level
+    whatever the population size. A `None` brain, like the brain of a dead actor, outputs zeros.
+    With `copies`, the network is repeated that many times, row `i + k * len(brains)` being the `k`th copy
+    of the `i`th brain, each copy learning on its own. Only the first copy is synced back to the brains.
+    """
+
+    def __init__(self, brains, copies=1):
+        self.brains = brains
+        self.count = len(brains) * copies
+        self.tick_length = Brain.TICK_LENGTH
+        self.threshold = Neuron.TRESHOLD_LEVEL
+        self.decay_rate = Neuron.DECAY_RATE
+        self.weight_alteration = Synapse.WEIGHT_ALTERATION_FACTOR
+        self.tick = 0
+        inputs, outputs, is_output, value, last_tick = [], [], [], [], []
+        src, dst, depth, edge_rows, weight, used = [], [], [], [], [], []
+        offset = 0
+        for row, brain in enumerate(brains):
+            if brain is None:
+                continue
+            self.tick_length = brain.tick_length
+            self.tick = max(self.tick, brain.tick)
+            inputs.extend((offset + i, row, i) for i in xrange(brain.input_count))
+            outputs.extend((offset + neuron, row, i) for i, neuron in enumerate(brain.output_index))
+            is_output.extend(brain.is_output)
+            value.extend(brain.value)
+            last_tick.extend(brain.last_tick)
+            src.extend(offset + neuron for neuron in brain.src)
+            dst.extend(offset + neuron for neuron in brain.dst)
+            depth.extend(brain.depth[neuron] for neuron in brain.dst)
+            edge_rows.extend([row] * len(brain.dst))
+            weight.extend(brain.weight)
+            used.extend(brain.used)
+            offset += brain.size
+        self.size = offset * copies
+        # neuron and row offsets of every copy
+        neurons = offset * np.arange(copies)[:, np.newaxis]
+        rows = len(brains) * np.arange(copies)[:, np.newaxis]
+        inputs = np.array(inputs, dtype=int).reshape(-1, 3)
+        outputs = np.array(outputs, dtype=int).reshape(-1, 3)
+        self.input_neurons = (inputs[:, 0] + neurons).ravel()
+        self.input_rows = (inputs[:, 1] + rows).ravel()
+        self.input_slots = np.tile(inputs[:, 2], copies)
+        self.output_neurons = (outputs[:, 0] + neurons).ravel()
+        self.output_rows = (outputs[:, 1] + rows).ravel()
+        self.output_slots = np.tile(outputs[:, 2], copies)
+        self.is_output = np.tile(np.array(is_output, dtype=bool), copies)
+        self.value = np.tile(np.array(value, dtype=float), copies)
+        self.last_tick = np.tile(np.array(last_tick, dtype=int), copies)
+
+        depth = np.tile(np.array(depth, dtype=int), copies)
+        self.order = np.argsort(depth, kind="mergesort")
+        depth = depth[self.order]
+        self.src = (np.array(src, dtype=int) + neurons).ravel()[self.order]
+        self.dst = (np.array(dst, dtype=int) + neurons).ravel()[self.order]
+        self.edge_rows = (np.array(edge_rows, dtype=int) + rows).ravel()[self.order]
+        self.weight = np.tile(np.array(weight, dtype=float), copies)[self.order]
+        self.used = np.tile(np.array(used, dtype=bool), copies)[self.order]
+        self.excitatory = self.weight >= 0.0
+        self.aims_hidden = ~self.is_output[self.dst]
+        self.levels = []
+        for level in np.unique(depth):
+            start, end = np.searchsorted(depth, [level, level + 1])
+            targets, inverse = np.unique(self.dst[start:end], return_inverse=True)
+            self.levels.append((start, end, targets, inverse, ~self.is_output[targets]))
+
+    def think(self, inputs, output_dimension, alive=None):
+        """Returns a (brains, output_dimension) array of outputs for a (brains, n) array of inputs
+
+        Brains whose row is False in `alive` neither think nor learn during this tick.
+        """
+        self.tick += 1
+        if not self.count:
+            return np.zeros((0, output_dimension), dtype=float)
+        inputs = np.asarray(inputs, dtype=float).reshape(self.count, -1)
+        emitted = np.ones(self.size, dtype=float)
+        firing = np.zeros(self.size, dtype=bool)
+        given = self.input_slots < inputs.shape[1]
+        if alive is not None:
+            given &= alive[self.input_rows]
+        emitted[self.input_neurons[given]] = inputs[self.input_rows[given], self.input_slots[given]]
+        firing[self.input_neurons[given]] = True
+        received = np.zeros(self.size, dtype=float)
+        propagated = np.zeros(len(self.weight), dtype=bool)
+        for start, end, targets, inverse, hidden in self.levels:
+            src = self.src[start:end]
+            active = firing[src]
+            propagated[start:end] = active
+            reached = inverse[active]
+            level_received = np.bincount(reached, weights=emitted[src[active]] * self.weight[start:end][active],
+                                         minlength=len(targets))
+            touched = np.bincount(reached, minlength=len(targets)) > 0
+            received[targets] = level_received
+            updated = hidden & touched
+            neurons = targets[updated]
+            elapsed = (self.tick - self.last_tick[neurons]) * self.tick_length
+            self.value[neurons] = self.value[neurons] * np.exp(-elapsed * self.decay_rate) + level_received[updated]
+            self.last_tick[neurons] = self.tick
+            firing[neurons] = self.value[neurons] > self.threshold
+        # a synapse is used when it made its aim fire, inverted for inhibitory ones
+        used = (firing[self.dst] & self.aims_hidden) == self.excitatory
+        self.used[propagated] = used[propagated]
+        alteration = np.where(self.used, self.weight, -self.weight) * self.weight_alteration
+        if alive is not None:
+            alteration *= alive[self.edge_rows]
+        self.weight += alteration
+        results = np.zeros((self.count, output_dimension), dtype=float)
+        kept = self.output_slots < output_dimension
+        results[self.output_rows[kept], self.output_slots[kept]] = received[self.output_neurons[kept]]
+        return results
+
+    def sync(self):
+        """Writes the learned state back to the compiled brains"""
+        weight = np.empty_like(self.weight)
+        weight[self.order] = self.weight
+        used = np.empty_like(self.used)
+        used[self.order] = self.used
+        start = 0
+        neuron = 0
+        for brain in self.brains:
+            if brain is None:
+                continue
+            end = start + len(brain.weight)
+            brain.weight = weight[start:end].tolist()
+            brain.used = used[start:end].tolist()
+            brain.value = self.value[neuron:neuron + brain.size].tolist()
+            brain.last_tick = self.last_tick[neuron:neuron + brain.size].tolist()
+            brain.tick = self.tick
+            start = end
+            neuron += brain.size
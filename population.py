@@ -1,12 +1,20 @@
-import random
+from operator import attrgetter
+import numpy as np
+import pareto
+from selection import RankSelection
+from streams import DEFAULT
 
 
 class Population(object):
-    def __init__(self, rank_probability=0.2, reverse_sort=False):
+    def __init__(self, rank_probability=0.2, reverse_sort=False, selection=None, rng=DEFAULT, objectives=None):
         self.actors = []
         self.sorted = False
         self.rank_probability = rank_probability
         self.reverse_sort = reverse_sort
+        self.selection = selection or RankSelection(rank_probability)
+        self.rng = rng
+        # with a function returning the objectives of an actor, actors are ranked by Pareto front
+        self.objectives = objectives
 
     def __len__(self):
         return len(self.actors)
@@ -37,32 +45,39 @@ class Population(object):
         self.sort()
         return self.actors[0]
 
+    def select_best_fitnesses(self, number):
+        self.sort()
+        return self.actors[:number]
+
     def select_worst_fitness(self):
         self.sort()
         return self.actors[-1]
 
     def select_by_rank(self):
-        self.sort()
-        for actor in self.actors:
-            if random.random() < self.rank_probability:
-                return actor
-        return self.actors[-1]
+        return self.select(1)[0]
 
-    @staticmethod
-    def cmp_actors(a, b):
-        if a.fitness < b.fitness:
-            return -1
-        if a.fitness > b.fitness:
-            return 1
-        return 0
+    def select(self, number):
+        """Returns `number` actors drawn by the selection strategy"""
+        self.sort()
+        return self.selection.select(self.actors, number, self.rng)
 
     def sort(self):
         """evaluate should always be called before sorting"""
         if self.sorted:
             return
-        self.actors.sort(cmp=self.cmp_actors, reverse=self.reverse_sort)
+        # actors restored without their objectives are still ranked by fitness
+        if self.objectives is not None and self.actors and all(actor.objectives is not None for actor in self.actors):
+            order = pareto.rank(np.array([actor.objectives for actor in self.actors], dtype=float))
+            self.actors = [self.actors[i] for i in order]
+        else:
+            self.actors.sort(key=attrgetter("fitness"), reverse=self.reverse_sort)
         self.sorted = True
 
+    def truncate(self, size):
+        """Keeps the `size` best actors"""
+        self.sort()
+        del self.actors[size:]
+
     def clear(self):
         self.actors = []
         self.sorted = False
@@ -71,3 +86,8 @@ class Population(object):
         for actor in self.actors:
             actor.fitness_evaluation(*args, **kwargs)
         self.sorted = False
+
+    def evaluate_objectives(self):
+        for actor in self.actors:
+            actor.objectives = self.objectives(actor)
+        self.sorted = False
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class Selection(object):
+    """Picks parents among actors sorted from the best to the worst fitness"""
+
+    def select(self, actors, number, rng):
+        return [actors[i] for i in self.select_ranks(len(actors), number, rng)]
+
+    def select_ranks(self, size, number, rng):
+        raise NotImplementedError
+
+
+class RankSelection(Selection):
+    """Walks down the ranking and stops at each actor with the given probability, the last one catching
+    whatever is left: a truncated geometric distribution over the ranks, sampled by bisection.
+    """
+
+    def __init__(self, probability):
+        self.probability = probability
+        self.cumulative = {}
+
+    def distribution(self, size):
+        if size not in self.cumulative:
+            cumulative = 1.0 - (1.0 - self.probability) ** np.arange(1, size + 1)
+            cumulative[-1] = 1.0
+            self.cumulative[size] = cumulative
+        return self.cumulative[size]
+
+    def select_ranks(self, size, number, rng):
+        return np.searchsorted(self.distribution(size), rng.state.random_sample(number), side="right")
+
+
+class TournamentSelection(Selection):
+    """Best of `size` actors drawn uniformly"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def select_ranks(self, size, number, rng):
+        return rng.state.randint(0, size, (number, self.size)).min(axis=1)
+
+
+class TruncationSelection(Selection):
+    """Uniform among the best `fraction` of the actors"""
+
+    def __init__(self, fraction):
+        self.fraction = fraction
+
+    def select_ranks(self, size, number, rng):
+        return rng.state.randint(0, max(1, int(size * self.fraction)), number)
@@ -0,0 +1,150 @@
+import numpy as np
+
+
+class SpatialGrid(object):
+    """Points of a bounded area bucketed in square cells, answering nearest point queries for many positions at once
+
+    Adding, removing or moving a point only touches its own slot, the points are sorted by cell again
+    lazily before the next query. A query visits the cells around each position ring by ring and
+    stops as soon as no point outside the visited square can be closer. With few points, comparing
+    every position to every point is cheaper than visiting the cells.
+    """
+    BRUTE_FORCE = 16
+
+    def __init__(self, size, cell):
+        self.cell = float(cell)
+        self.shape = (int(-(-size[0] // cell)), int(-(-size[1] // cell)))
+        self.positions = np.zeros((0, 2), dtype=float)
+        self.cells = np.zeros(0, dtype=int)
+        self.alive = np.zeros(0, dtype=bool)
+        self.free = []
+        self.count = 0
+        self.order = None  # live slots sorted by cell, None when out of date
+        self.listed = None  # (id, position) of the live slots, None when out of date
+        self.starts = None
+        self.rings = {}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Iterates over the (id, position) of every point"""
+        if self.listed is None:
+            ids = np.flatnonzero(self.alive)
+            self.listed = zip(ids.tolist(), [tuple(position) for position in self.positions[ids].tolist()])
+        return iter(self.listed)
+
+    def cell_of(self, position):
+        x = min(max(int(position[0] // self.cell), 0), self.shape[0] - 1)
+        y = min(max(int(position[1] // self.cell), 0), self.shape[1] - 1)
+        return x * self.shape[1] + y
+
+    def add(self, position):
+        """Returns the id of the new point"""
+        if not self.free:
+            capacity = max(4, 2 * len(self.alive))
+            grown = capacity - len(self.alive)
+            self.free = range(capacity - 1, len(self.alive) - 1, -1)
+            self.positions = np.concatenate([self.positions, np.zeros((grown, 2), dtype=float)])
+            self.cells = np.concatenate([self.cells, np.zeros(grown, dtype=int)])
+            self.alive = np.concatenate([self.alive, np.zeros(grown, dtype=bool)])
+        id_ = self.free.pop()
+        self.alive[id_] = True
+        self.count += 1
+        self.move(id_, position)
+        self.order = None
+        self.listed = None
+        return id_
+
+    def remove(self, id_):
+        self.alive[id_] = False
+        self.free.append(id_)
+        self.count -= 1
+        self.order = None
+        self.listed = None
+
+    def move(self, id_, position):
+        self.positions[id_] = position
+        self.listed = None
+        cell = self.cell_of(position)
+        if cell != self.cells[id_]:
+            self.order = None
+        self.cells[id_] = cell
+
+    def clear(self):
+        self.alive[:] = False
+        self.free = range(len(self.alive) - 1, -1, -1)
+        self.count = 0
+        self.order = None
+        self.listed = None
+
+    def index(self):
+        if self.order is None:
+            live = np.flatnonzero(self.alive)
+            self.order = live[np.argsort(self.cells[live], kind="mergesort")]
+            self.starts = np.searchsorted(self.cells[self.order], np.arange(self.shape[0] * self.shape[1] + 1))
+        return self.order
+
+    def ring(self, inner, outer):
+        """Offsets of the cells between `inner` and `outer` cells away from the center one"""
+        if (inner, outer) not in self.rings:
+            span = np.arange(-outer, outer + 1)
+            dx, dy = np.meshgrid(span, span, indexing="ij")
+            border = np.maximum(abs(dx), abs(dy)).ravel() >= inner
+            self.rings[inner, outer] = (dx.ravel()[border], dy.ravel()[border])
+        return self.rings[inner, outer]
+
+    def nearest(self, points, radius=None):
+        """Returns the id of the nearest point to every position and the distance to it, -1 and inf when empty
+
+        With a `radius`, points further than that may be ignored.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        ids = np.full(len(points), -1, dtype=int)
+        distances = np.full(len(points), np.inf)
+        if not self.count or not len(points):
+            return ids, distances
+        if self.count <= self.BRUTE_FORCE:
+            live = np.flatnonzero(self.alive)
+            vectors = self.positions[live] - points[:, np.newaxis]
+            lengths = np.sqrt(vectors[:, :, 0] ** 2 + vectors[:, :, 1] ** 2)
+            best = lengths.argmin(axis=1)
+            return live[best], lengths[np.arange(len(points)), best]
+        order = self.index()
+        width, height = self.shape
+        cx = np.clip((points[:, 0] // self.cell).astype(int), 0, width - 1)
+        cy = np.clip((points[:, 1] // self.cell).astype(int), 0, height - 1)
+        pending = np.arange(len(points))
+        # the first square is wide enough to hold about one point
+        inner, outer = 0, int(np.sqrt(width * height / float(self.count)) // 2)
+        if radius is not None:
+            outer = min(outer, int(radius // self.cell) + 1)
+        while len(pending) and inner < max(width, height):
+            dx, dy = self.ring(inner, outer)
+            x = (cx[pending][:, np.newaxis] + dx).ravel()
+            y = (cy[pending][:, np.newaxis] + dy).ravel()
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            cells = x[inside] * height + y[inside]
+            queries = np.repeat(pending, len(dx))[inside]
+            starts = self.starts[cells]
+            counts = self.starts[cells + 1] - starts
+            pairs = np.repeat(np.arange(len(cells)), counts)
+            slots = order[np.arange(len(pairs)) - np.repeat(np.cumsum(counts) - counts, counts) + starts[pairs]]
+            queries = queries[pairs]
+            vectors = self.positions[slots] - points[queries]
+            lengths = np.sqrt(vectors[:, 0] ** 2 + vectors[:, 1] ** 2)
+            ranked = np.lexsort((lengths, queries))
+            first = ranked[np.r_[True, queries[ranked][1:] != queries[ranked][:-1]]] if len(ranked) else ranked
+            closer = lengths[first] < distances[queries[first]]
+            ids[queries[first][closer]] = slots[first][closer]
+            distances[queries[first][closer]] = lengths[first][closer]
+            # whatever lies beyond the visited cells is at least as far as the border of the visited square
+            x, y = points[pending, 0], points[pending, 1]
+            low = np.minimum(np.minimum(x - (cx[pending] - outer) * self.cell, (cx[pending] + outer + 1) * self.cell - x),
+                             np.minimum(y - (cy[pending] - outer) * self.cell, (cy[pending] + outer + 1) * self.cell - y))
+            unsure = distances[pending] > low
+            if radius is not None:
+                unsure &= low < radius
+            pending = pending[unsure]
+            inner, outer = outer + 1, outer + 1
+        return ids, distances
@@ -0,0 +1,158 @@
+from collections import deque
+from world import World
+from genotype import Genotype
+from kernel import PopulationKernel
+from convergence import Convergence
+import metrics
+
+
+class Cohort(object):
+    """Actors starting their evaluation episode together, in a world with a target of their own"""
+
+    def __init__(self, world, actors):
+        self.world = world
+        self.actors = actors
+        self.kernel = None
+        self.convergence = None
+        self.result = None  # pending simulation when the workers simulate the cohort
+
+
+class SteadyState(object):
+    """Evolves without generation barriers
+
+    Actors are simulated in cohorts of `size` whose episodes overlap. As soon as a cohort is done, its
+    actors join the population in place of the worst ones and a new cohort bred from the population
+    starts. In a single process the cohorts start TICKS_PER_GEN / cohorts ticks apart; with a
+    ParallelSimulator every cohort is a task of its own and enough of them are queued for the workers
+    never to wait. A generation is still counted every POP_SIZE evaluations, to checkpoint, export
+    and stop.
+    """
+
+    def __init__(self, experiment, size):
+        self.experiment = experiment
+        self.size = size
+        self.cohorts = max(1, experiment.POP_SIZE // size)
+        if experiment.simulator is not None:
+            self.cohorts = max(self.cohorts, 2 * experiment.simulator.workers)
+        self.interval = max(1, experiment.world.TICKS_PER_GEN // self.cohorts)
+        self.running = deque()
+        self.evaluations = 0
+
+    def start(self):
+        for _ in self.run():
+            pass
+        if self.experiment.world.loop:
+            self.experiment.stop()
+
+    def run(self):
+        """Evolves until the experiment stops, yielding every time a generation has been counted
+
+        Ends after the last generation has been yielded, leaving the caller to stop the experiment.
+        """
+        world = self.experiment.world
+        world.loop = True
+        while world.loop:
+            self.running.append(self.launch())
+            done = []
+            if self.experiment.simulator is not None:
+                if len(self.running) >= self.cohorts:
+                    done.append(self.running.popleft())
+            else:
+                self.advance(self.interval)
+                while self.running and self.running[0].world.tick >= world.TICKS_PER_GEN:
+                    done.append(self.running.popleft())
+            for cohort in done:
+                if world.loop and self.retire(cohort):
+                    yield
+                    if not world.loop or self.experiment.finished():
+                        return
+                    self.experiment.current_generation += 1
+
+    def breed(self):
+        """Returns the genotypes of a new cohort, random ones until the population is complete
+
+        Small cohorts are launched a tick apart, so the population may still be empty once enough are running.
+        """
+        experiment = self.experiment
+        if (not len(experiment.population)
+                or len(experiment.population) + self.size * len(self.running) < experiment.POP_SIZE):
+            return Genotype.batch(self.size, experiment.rng)
+        genotypes = Genotype.batch(self.size * experiment.RANDOM_ACTORS_NUMBER // experiment.POP_SIZE, experiment.rng)
+        immigrants = experiment.immigrants[:self.size - len(genotypes)]
+        del experiment.immigrants[:len(immigrants)]
+        genotypes.extend(immigrants)
+        parents = experiment.population.select(2 * (self.size - len(genotypes)))
+        genotypes.extend(Genotype.reproduce_batch([father.genotype for father in parents[::2]],
+                                                  [mother.genotype for mother in parents[1::2]],
+                                                  experiment.REPRODUCTION_POLICY, experiment.rng))
+        return genotypes
+
+    def launch(self):
+        experiment = self.experiment
+        world = World(experiment, experiment.world.target_count, experiment.world.obstacle_count,
+                      len(experiment.world.scenarios))
+        world.reset()
+        with metrics.current.timer("reproduction"):
+            actors = [experiment.create_actor(genotype, world) for genotype in self.breed()]
+        cohort = Cohort(world, actors)
+        if experiment.simulator is not None:
+            cohort.result = experiment.simulator.submit(experiment, world, actors, world.TICKS_PER_GEN)
+        else:
+            with metrics.current.timer("phenotype_build"):
+                cohort.kernel = PopulationKernel(world, actors)
+            metrics.current.count("dead_actors", len(cohort.kernel.actors) - len(cohort.kernel.alive_index))
+            if experiment.early_stop:
+                cohort.convergence = Convergence()
+        return cohort
+
+    def advance(self, ticks):
+        """Runs the next `ticks` simulation steps of every running cohort"""
+        with metrics.current.timer("simulation"):
+            for cohort in self.running:
+                if not len(cohort.kernel.alive_index):
+                    # no actor can move, the outcome is known without a step
+                    if cohort.convergence is not None:
+                        self.experiment.end_episode("no_live_actors", cohort.world.TICKS_PER_GEN - cohort.world.tick)
+                    cohort.world.tick = cohort.world.TICKS_PER_GEN
+                    continue
+                for _ in xrange(min(ticks, cohort.world.TICKS_PER_GEN - cohort.world.tick)):
+                    cohort.kernel.step()
+                    cohort.world.tick += 1
+                    rule = cohort.convergence.update(cohort.kernel) if cohort.convergence is not None else None
+                    if rule is not None:
+                        self.experiment.end_episode(rule, cohort.world.TICKS_PER_GEN - cohort.world.tick)
+                        cohort.world.tick = cohort.world.TICKS_PER_GEN
+                        break
+        metrics.current.count("ticks", ticks)
+
+    def retire(self, cohort):
+        """Evaluates a cohort done with its episode and keeps the POP_SIZE best actors
+
+        Returns whether this completed a generation.
+        """
+        experiment = self.experiment
+        if cohort.result is not None:
+            with metrics.current.timer("simulation"):
+                results, rule, ran = cohort.result.get()
+            if rule is not None:
+                experiment.end_episode(rule, cohort.world.TICKS_PER_GEN - ran)
+            for actor, (fitness, position, positions) in zip(cohort.actors, results):
+                actor.position = position
+                actor.positions = positions
+                actor.fitness = fitness
+        with metrics.current.timer("fitness"):
+            if cohort.kernel is not None:
+                cohort.kernel.sync()
+                for actor in cohort.actors:
+                    actor.fitness_evaluation()
+            for actor in cohort.actors:
+                if experiment.multi_objective:
+                    actor.objectives = experiment.evaluate_objectives(actor)
+                experiment.population.append(actor)
+            experiment.population.truncate(experiment.POP_SIZE)
+        self.evaluations += len(cohort.actors)
+        if self.evaluations < experiment.POP_SIZE:
+            return False
+        self.evaluations -= experiment.POP_SIZE
+        experiment.end_generation(stop=False)
+        return True
@@ -0,0 +1,65 @@
+"""Seeded random number streams.
+
+Every experiment draws from its own stream instead of the global `random` and `numpy.random`
+states, so that runs are reproducible whatever else shares the process, and processes of the same
+run get independent streams from a common seed (see `RandomStream.spawn`).
+"""
+import os
+import binascii
+import numpy as np
+
+
+class RandomStream(object):
+    """Random numbers from a numpy RandomState, scalar uniforms being drawn BATCH at a time
+
+    `state` is meant for the array draws, `random`, `randint` and `choice` for the scalar ones.
+    """
+    BATCH = 4096
+
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = int(binascii.hexlify(os.urandom(4)), 16)
+        # a list of integers seeds the state as a whole
+        self.key = list(seed) if isinstance(seed, (list, tuple)) else [seed]
+        self.state = np.random.RandomState(self.key)
+        self.batch = []
+        self.batch_state = None  # state the current batch was drawn from, to draw it again when restored
+        self.position = 0
+
+    def spawn(self, index):
+        """Returns the `index`-th child stream, independent of this one and of its other children"""
+        return RandomStream(self.key + [index])
+
+    def random(self):
+        if self.position == len(self.batch):
+            self.batch_state = self.state.get_state()
+            self.batch = self.state.random_sample(self.BATCH).tolist()
+            self.position = 0
+        self.position += 1
+        return self.batch[self.position - 1]
+
+    def randint(self, low, high):
+        """Integer between `low` and `high` included, as random.randint"""
+        return low + int(self.random() * (high - low + 1))
+
+    def choice(self, sequence):
+        return sequence[int(self.random() * len(sequence))]
+
+    def getstate(self):
+        """Returns the state of the array draws, and where the scalar draws are in their batch"""
+        return self.state.get_state(), self.batch_state, self.position
+
+    def setstate(self, state):
+        numpy_state, self.batch_state, self.position = state
+        self.batch = []
+        if self.batch_state is not None:
+            self.state.set_state(self.batch_state)
+            self.batch = self.state.random_sample(self.BATCH).tolist()
+        self.state.set_state(numpy_state)
+
+
+# for the code running outside of an experiment
+DEFAULT = RandomStream()
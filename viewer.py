@@ -0,0 +1,112 @@
+import pygame
+from pygame.locals import *
+from world import World
+from cache import LRUCache
+import metrics
+
+
+class Viewer(World):
+    """Pygame front-end running the same fixed time step simulation as World
+
+    Frames are drawn at most RENDER_FPS times per second whatever the simulation rate, which is FPS
+    steps per second, or as many as the CPU allows while fast-forwarding.
+    """
+    RENDER_FPS = 30
+    MAX_STEPS_PER_FRAME = 10  # keeps the window responsive when the simulation can't keep up
+    SPRITE_CACHE_SIZE = 2000
+
+    def __init__(self, experiment, render_fps=None, targets=None, obstacles=None, scenarios=None):
+        super(Viewer, self).__init__(experiment, targets, obstacles, scenarios)
+        self.screen = pygame.display.set_mode(self.SIZE, DOUBLEBUF)
+        self.time = pygame.time.Clock()
+        self.render_fps = render_fps or self.RENDER_FPS
+        self.paused = False
+        self.fast_forward = False
+        self.lag = 0.0  # simulation time in milliseconds the steps are behind the real time
+        self.sprites = LRUCache(self.SPRITE_CACHE_SIZE)
+
+    def interact(self):
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                self.experiment.stop()
+            if event.type == KEYDOWN:
+                pass
+            if event.type == KEYUP:
+                if event.key == K_ESCAPE:
+                    self.experiment.stop()
+                if event.key == K_p:
+                    if self.paused:
+                        self.resume()
+                    else:
+                        self.pause()
+                if event.key == K_n:
+                    self.experiment.next_generation()
+                if event.key == K_f:
+                    self.fast_forward = not self.fast_forward
+                    self.lag = 0.0
+
+    def start(self):
+        self.loop = True
+        while self.loop:
+            self.interact()
+            if self.loop and not self.paused:
+                if self.fast_forward:
+                    deadline = pygame.time.get_ticks() + 1000.0 / self.render_fps
+                    while self.loop and pygame.time.get_ticks() < deadline:
+                        self.step()
+                else:
+                    self.lag = min(self.lag + self.time.get_time(), self.MAX_STEPS_PER_FRAME * self.DT)
+                    while self.loop and self.lag >= self.DT:
+                        self.lag -= self.DT
+                        self.step()
+            if self.loop:
+                self.render()
+            self.time.tick(self.render_fps)
+
+    def step(self):
+        self.loop_step()
+        self.experiment.converged()
+        if self.TICKS_PER_GEN and self.tick >= self.TICKS_PER_GEN:
+            self.experiment.next_generation()
+
+    def reset(self):
+        super(Viewer, self).reset()
+        pygame.display.set_caption('Generation {0}'.format(self.experiment.current_generation))
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.lag = 0.0
+
+    def render(self):
+        with metrics.current.timer("rendering"):
+            self.screen.fill(0)
+            for _, (x, y) in self.obstacles:
+                pygame.draw.circle(self.screen, 0x808080, (int(x), int(y)), self.OBSTACLE_RADIUS)
+            for _, (x, y) in self.targets:
+                pygame.draw.rect(self.screen, 0xFFFFFF, (int(x), int(y), 6, 6))
+            self.experiment.draw()
+            pygame.display.flip()
+
+    def sprite(self, color, points):
+        """Returns the polygon rasterized once on a transparent surface, and the offset of that surface"""
+        key = (color, points)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            left = min([x for x, _ in points])
+            top = min([y for _, y in points])
+            surface = pygame.Surface((max([x for x, _ in points]) - left + 1,
+                                      max([y for _, y in points]) - top + 1)).convert()
+            transparent = 1 if color == 0 else 0
+            surface.fill(transparent)
+            surface.set_colorkey(transparent)
+            pygame.draw.polygon(surface, color, [(x - left, y - top) for x, y in points])
+            sprite = (surface, (left, top))
+            self.sprites.put(key, sprite)
+        return sprite
+
+    def draw(self, color, points, position):
+        surface, offset = self.sprite(color, points)
+        self.screen.blit(surface, (int(position[0]) + offset[0], int(position[1]) + offset[1]))
@@ -1,68 +1,105 @@
-import time
-import random
-import pygame
-from pygame.locals import *
+import math
+import numpy as np
+from spatial import SpatialGrid
+import metrics
 
 
 class World(object):
     FPS = 30
     SIZE = (1024, 768)
     TIME_BETWEEN_GEN = 4
+    DT = 1000.0 / FPS  # fixed simulation time step in milliseconds
+    TICKS_PER_GEN = FPS * TIME_BETWEEN_GEN
+    TARGETS = 1  # actors head for the nearest one
+    OBSTACLES = 0
+    OBSTACLE_RADIUS = 20  # actors can't move closer than that to the center of an obstacle
+    GRID_CELL = 32  # side of the cells of the target and obstacle indexes
+    SCENARIOS = 1  # layouts of targets and obstacles every actor is simulated in at once
 
-    def __init__(self, experiment):
+    def __init__(self, experiment, targets=None, obstacles=None, scenarios=None):
         self.experiment = experiment
-        self.screen = pygame.display.set_mode(self.SIZE, DOUBLEBUF)
-        self.time = pygame.time.Clock()
-        self.paused = False
         self.loop = True
-        self.tslf = 0  # time since last frame in milliseconds
-
-    def interact(self):
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                self.experiment.stop()
-            if event.type == KEYDOWN:
-                pass
-            if event.type == KEYUP:
-                if event.key == K_ESCAPE:
-                    self.experiment.stop()
-                if event.key == K_p:
-                    if self.paused:
-                        self.resume()
-                    else:
-                        self.pause()
-                if event.key == K_n:
-                    self.experiment.next_generation()
+        self.tick = 0
+        self.target_count = self.TARGETS if targets is None else targets
+        self.obstacle_count = self.OBSTACLES if obstacles is None else obstacles
+        self.targets = SpatialGrid(self.SIZE, self.GRID_CELL)
+        self.obstacles = SpatialGrid(self.SIZE, self.GRID_CELL)
+        # the first scenario is this world itself, the others only hold their layout
+        self.scenarios = [self] + [World(None) for _ in xrange((scenarios or self.SCENARIOS) - 1)]
+        self.tslf = self.DT  # time since last frame in milliseconds
 
     def start(self):
-        pygame.display.set_caption('Generation {0}'.format(self.experiment.current_generation))
-        self.point = (random.randint(100, self.SIZE[0]-100),
-                      random.randint(100, self.SIZE[1]-100))
-        next_gen = time.time()
         self.loop = True
         while self.loop:
-            self.interact()
-            if self.loop and not self.paused:
-                self.loop_step()
-                if self.TIME_BETWEEN_GEN and time.time() - next_gen > self.TIME_BETWEEN_GEN:
-                    self.experiment.next_generation()
+            self.experiment.simulate(self.TICKS_PER_GEN - self.tick)
+            if self.loop:
+                self.experiment.next_generation()
 
-    def stop(self):
-        self.loop = False
+    def reset(self):
+        """Places new targets and obstacles in every scenario and rewinds the tick counter for a new generation"""
+        self.tick = 0
+        rng = self.experiment.rng
+        for world in self.scenarios:
+            world.set_layout(([(rng.randint(100, self.SIZE[0]-100), rng.randint(100, self.SIZE[1]-100))
+                               for _ in xrange(self.target_count)],
+                              [(rng.randint(0, self.SIZE[0]), rng.randint(0, self.SIZE[1]))
+                               for _ in xrange(self.obstacle_count)]))
+
+    def layout(self):
+        """Returns the positions of the targets and of the obstacles, hashable and cheap to send to another process"""
+        return (tuple(position for _, position in self.targets),
+                tuple(position for _, position in self.obstacles))
+
+    def set_layout(self, layout):
+        targets, obstacles = layout
+        self.targets.clear()
+        self.obstacles.clear()
+        for position in targets:
+            self.targets.add(position)
+        for position in obstacles:
+            self.obstacles.add(position)
+
+    def layouts(self):
+        """Returns the layout of every scenario"""
+        return tuple(world.layout() for world in self.scenarios)
 
-    def pause(self):
-        self.paused = True
+    def set_layouts(self, layouts):
+        self.scenarios = [self] + [World(None) for _ in layouts[1:]]
+        for world, layout in zip(self.scenarios, layouts):
+            world.set_layout(layout)
 
-    def resume(self):
-        self.paused = False
-        self.time.tick(self.FPS)
+    def target_distance(self, position):
+        """Distance from the position to the nearest target"""
+        if len(self.targets) <= SpatialGrid.BRUTE_FORCE:
+            return min([float(math.sqrt((position[0] - float(x)) ** 2 + (position[1] - float(y)) ** 2))
+                        for _, (x, y) in self.targets] or [float("inf")])
+        vectors = self.targets.positions[self.targets.alive] - position
+        return float(np.sqrt(vectors[:, 0] ** 2 + vectors[:, 1] ** 2).min())
+
+    def nearest_targets(self, positions):
+        """Returns the position of the nearest target to each of the (n, 2) positions, itself when there is none"""
+        if not len(self.targets):
+            return np.array(positions, dtype=float)
+        if len(self.targets) == 1:
+            return np.repeat(self.targets.positions[self.targets.alive], len(positions), axis=0)
+        ids, _ = self.targets.nearest(positions)
+        targets = self.targets.positions[ids]
+        targets[ids < 0] = positions[ids < 0]
+        return targets
+
+    def blocked(self, positions):
+        """Returns which of the (n, 2) positions are inside an obstacle"""
+        if not len(self.obstacles):
+            return np.zeros(len(positions), dtype=bool)
+        return self.obstacles.nearest(positions, self.OBSTACLE_RADIUS)[1] < self.OBSTACLE_RADIUS
+
+    def stop(self):
+        self.loop = False
 
     def loop_step(self):
-        self.tslf = float(self.time.tick(self.FPS))
-        self.screen.fill(0)
-        pygame.draw.polygon(self.screen, 0xFFFFFF, map(lambda p: tuple(map(sum, zip(p, self.point))), [(0, 0), (5, 0), (5, 5), (0, 5)]))
         self.experiment.update()
-        pygame.display.flip()
+        self.tick += 1
+        metrics.current.count("ticks")
 
-    def draw(self, color, points):
-        pygame.draw.polygon(self.screen, color, points)
+    def draw(self, color, points, position):
+        pass